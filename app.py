@@ -1,13 +1,26 @@
+import time
+# Measured from here so /metrics can report how long importing the app took
+IMPORT_STARTED = time.perf_counter()
+
+import io
 import os
 import json
+import zipfile
 import numpy as np
-from flask import Flask, request, render_template, jsonify, redirect, url_for
+from flask import (Flask, Response, request, render_template, jsonify, redirect, url_for, stream_with_context,
+                   send_from_directory)
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
-from PIL import Image
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-import cv2
+from inference_batcher import InferenceBatcher
+from image_io import MAX_AUGMENTED_VIEWS, augmented_views, decode_image
+from prediction_cache import PredictionCache, create_prediction_cache
+from model_runtime import load_runtime, runtime_version
+from model_server import RemoteRuntime, authkey
+from training_jobs import TERMINAL_STATES, TrainingJobManager
+from model_registry import ModelHandle, ModelRegistry, RegistryWatcher
+from metrics import Metrics
+from class_index import ClassIndex, load_localized_info
+from model_loader import BackgroundModelLoader
+from upload_store import UploadStore
 
 app = Flask(__name__)
 CORS(app)
@@ -17,20 +30,165 @@ app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Inference runtime: 'keras', 'tflite_fp16', 'tflite_int8' or 'onnx' (see train_model.export_serving_models)
+app.config['MODEL_RUNTIME'] = os.environ.get('MODEL_RUNTIME', 'keras')
+
+# Model sharing across gunicorn workers:
+# MODEL_SERVER - Unix socket of a model_server.py process; workers forward tensors to it
+#                instead of loading their own copy (TensorFlow is then never imported here)
+# PRELOAD_MODEL - load at import time so `gunicorn --preload` shares the weights copy-on-write
+app.config['MODEL_SERVER'] = os.environ.get('MODEL_SERVER', '')
+app.config['PRELOAD_MODEL'] = os.environ.get('PRELOAD_MODEL', '0') == '1'
+if app.config['MODEL_SERVER']:
+    authkey()  # Fails at startup, not on the first prediction, when MODEL_SERVER_AUTHKEY is unset
+elif app.config['PRELOAD_MODEL'] and app.config['MODEL_RUNTIME'] == 'keras':
+    # TensorFlow's thread pools do not survive fork: every worker's first predict would hang
+    raise RuntimeError("PRELOAD_MODEL=1 cannot be used with MODEL_RUNTIME=keras; "
+                       "use a tflite_* runtime, or share the Keras model through MODEL_SERVER")
+
+# Otherwise each worker loads the model on a background thread, started at import with
+# BACKGROUND_LOAD=1 or by the first request; /model_status reports 'warming' until it is ready.
+# MODEL_WARMUP runs dummy batches through a new model before it serves (also on hot reloads).
+app.config['BACKGROUND_LOAD'] = os.environ.get('BACKGROUND_LOAD', '0') == '1'
+app.config['MODEL_WARMUP'] = os.environ.get('MODEL_WARMUP', '1') == '1'
+
+# Micro-batching of concurrent /upload requests
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('BATCH_MAX_SIZE', 16))
+app.config['BATCH_MAX_WAIT_MS'] = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+app.config['PREDICT_TIMEOUT'] = float(os.environ.get('PREDICT_TIMEOUT', 30))
+
+# Test-time augmentation: when the top-1 confidence is below TTA_THRESHOLD, TTA_VIEWS flipped and
+# cropped views of the upload run as one batch and their probabilities are averaged in (max 11 views)
+app.config['TTA'] = os.environ.get('TTA', '0') == '1'
+app.config['TTA_THRESHOLD'] = float(os.environ.get('TTA_THRESHOLD', 0.6))
+# Clamped to the views augmented_views can produce
+app.config['TTA_VIEWS'] = min(max(int(os.environ.get('TTA_VIEWS', 8)), 1), MAX_AUGMENTED_VIEWS)
+# Classes (with probabilities) listed in each response's top_k
+app.config['TOP_K'] = int(os.environ.get('TOP_K', 3))
+
+# Bulk scoring through /predict_batch
+app.config['PREDICT_BATCH_SIZE'] = int(os.environ.get('PREDICT_BATCH_SIZE', 32))
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+
+# Uploads are decoded in memory; keeping a copy on disk is optional and asynchronous
+app.config['SAVE_UPLOADS'] = os.environ.get('SAVE_UPLOADS', '1') == '1'
+# Stored uploads: the result card shows a thumbnail; originals are kept unless UPLOAD_KEEP_ORIGINALS=0.
+# A background sweeper removes files older than UPLOAD_MAX_AGE seconds, then the oldest ones
+# while the folder exceeds UPLOAD_MAX_BYTES (0 disables either limit).
+app.config['UPLOAD_KEEP_ORIGINALS'] = os.environ.get('UPLOAD_KEEP_ORIGINALS', '1') == '1'
+app.config['UPLOAD_THUMBNAIL_SIZE'] = int(os.environ.get('UPLOAD_THUMBNAIL_SIZE', 320))
+app.config['UPLOAD_THUMBNAIL_FORMAT'] = os.environ.get('UPLOAD_THUMBNAIL_FORMAT', 'webp')
+app.config['UPLOAD_MAX_BYTES'] = int(os.environ.get('UPLOAD_MAX_BYTES', 1024 ** 3))
+app.config['UPLOAD_MAX_AGE'] = float(os.environ.get('UPLOAD_MAX_AGE', 7 * 86400))
+app.config['UPLOAD_SWEEP_INTERVAL'] = float(os.environ.get('UPLOAD_SWEEP_INTERVAL', 600))
+
+# Prediction cache: 'memory' (per worker), 'sqlite' (shared by all workers) or 'off'
+app.config['PREDICTION_CACHE'] = os.environ.get('PREDICTION_CACHE', 'memory')
+app.config['PREDICTION_CACHE_PATH'] = os.environ.get('PREDICTION_CACHE_PATH', 'cache/prediction_cache.sqlite3')
+app.config['PREDICTION_CACHE_SIZE'] = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+app.config['PREDICTION_CACHE_TTL'] = float(os.environ.get('PREDICTION_CACHE_TTL', 86400))
+app.config['PERCEPTUAL_CACHE'] = os.environ.get('PERCEPTUAL_CACHE', '0') == '1'
+
+# Training reads dataset_shards.py output from here when it exists
+app.config['TRAINING_SHARDS'] = os.environ.get('TRAINING_SHARDS', 'data/shards')
+# Model preset trained by /train_model: baseline, gap, separable or mobilenet (see train_model.ARCHITECTURES)
+app.config['TRAINING_ARCHITECTURE'] = os.environ.get('TRAINING_ARCHITECTURE', 'baseline')
+# Training job state and progress, shared by every worker (one job runs at a time across them)
+app.config['TRAINING_JOBS_PATH'] = os.environ.get('TRAINING_JOBS_PATH', 'cache/training_jobs.sqlite3')
+
+# Versioned models: workers poll the registry and hot-swap to its active version
+app.config['MODEL_REGISTRY'] = os.environ.get('MODEL_REGISTRY', 'models/registry')
+app.config['MODEL_WATCH_INTERVAL'] = float(os.environ.get('MODEL_WATCH_INTERVAL', 10))
+
+# Metrics: each worker snapshots its samples into METRICS_DIR so /metrics covers every worker
+# (clear the directory when redeploying). Set to '' to report only the answering process.
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', 'cache/metrics')
+
+# Language of disease descriptions/remedies, from data/disease_info.<locale>.json ('' = default file)
+app.config['DISEASE_INFO_LOCALE'] = os.environ.get('DISEASE_INFO_LOCALE') or None
+
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Global variables for model and class names
-model = None
-class_names = []
+# The loaded model, its class names and version as one immutable ModelHandle.
+# Reloads replace the handle in a single assignment; readers take it once per request.
+model_handle = None
 disease_info = {}
+localized_disease_info = {}
+# ClassIndex per distinct class list, so a hot-swapped model with new classes gets its own
+class_indexes = {}
+
+model_registry = ModelRegistry(app.config['MODEL_REGISTRY'])
+
+metrics = Metrics(directory=app.config['METRICS_DIR'] or None)
+metrics.declare('requests_total', 'counter', 'HTTP requests by endpoint and status code')
+metrics.declare('errors_total', 'counter', 'Predictions that returned an error, by endpoint')
+metrics.declare('request_seconds', 'histogram', 'Request latency by endpoint')
+metrics.declare('stage_seconds', 'histogram', 'Time spent in each stage of handling an upload')
+metrics.declare('inference_seconds', 'histogram', 'model.predict time per batch')
+metrics.declare('batch_size', 'histogram', 'Images per model.predict call',
+                buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+metrics.declare('prediction_cache_total', 'counter', 'Prediction cache lookups by result')
+metrics.declare('model_loaded', 'gauge', '1 when a model is loaded in this worker')
+metrics.declare('model_load_seconds', 'gauge', 'Duration of the last model load in this worker')
+metrics.declare('model_warmup_seconds', 'gauge', 'Duration of the warm-up forward passes of the last model load')
+metrics.declare('import_seconds', 'gauge', 'Time taken to import the app module in this worker')
+metrics.declare('first_prediction_seconds', 'gauge', 'Time from app import to the first served prediction')
+metrics.declare('model_info', 'gauge', 'Version of the model served by this worker')
+metrics.declare('inference_queue_depth', 'gauge', 'Images waiting for the micro-batcher')
+metrics.declare('tta_total', 'counter', 'Low-confidence predictions re-run with test-time augmentation')
+metrics.declare('upload_storage_bytes', 'gauge', 'Size of stored uploads and thumbnails at the last retention sweep')
+
+first_prediction_done = False
+
+def run_model_batch(images):
+    """Run the current model on a batch; each row is paired with the handle that produced it"""
+    global first_prediction_done
+    handle = model_handle
+    with metrics.timer('inference_seconds'):
+        predictions = handle.model.predict(images)
+    metrics.observe('batch_size', len(images))
+    if not first_prediction_done:
+        first_prediction_done = True
+        metrics.set('first_prediction_seconds', time.perf_counter() - IMPORT_STARTED)
+    return [(probabilities, handle) for probabilities in predictions]
+
+batcher = InferenceBatcher(
+    run_model_batch,
+    max_batch_size=app.config['BATCH_MAX_SIZE'],
+    max_wait_ms=app.config['BATCH_MAX_WAIT_MS']
+)
+
+metrics.add_collector(lambda: metrics.set('inference_queue_depth', batcher.stats()['queue_depth']))
+
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    keep_originals=app.config['UPLOAD_KEEP_ORIGINALS'],
+    thumbnail_size=app.config['UPLOAD_THUMBNAIL_SIZE'],
+    thumbnail_format=app.config['UPLOAD_THUMBNAIL_FORMAT'],
+    max_bytes=app.config['UPLOAD_MAX_BYTES'],
+    max_age=app.config['UPLOAD_MAX_AGE'],
+    sweep_interval=app.config['UPLOAD_SWEEP_INTERVAL']
+)
+
+metrics.add_collector(lambda: metrics.set('upload_storage_bytes', upload_store.stats()['bytes']))
+
+prediction_cache = create_prediction_cache(
+    app.config['PREDICTION_CACHE'],
+    path=app.config['PREDICTION_CACHE_PATH'],
+    max_entries=app.config['PREDICTION_CACHE_SIZE'],
+    ttl=app.config['PREDICTION_CACHE_TTL'],
+    perceptual=app.config['PERCEPTUAL_CACHE']
+)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def load_disease_info():
     """Load disease information and remedies"""
-    global disease_info
+    global disease_info, localized_disease_info
+    localized_disease_info = load_localized_info('data/disease_info.json')
+    class_indexes.clear()
     try:
         with open('data/disease_info.json', 'r') as f:
             disease_info = json.load(f)
@@ -118,119 +276,559 @@ def load_disease_info():
                 ]
             }
         }
+    if model_handle is not None:
+        get_class_index(model_handle.class_names)
 
-def load_ml_model():
-    """Load the trained CNN model"""
-    global model, class_names
-    try:
-        model = load_model('models/plant_disease_model.h5')
+def get_class_index(class_names):
+    """Class metadata index for a model's class list, built on first use and then shared"""
+    key = tuple(class_names)
+    index = class_indexes.get(key)
+    if index is None:
+        index = class_indexes[key] = ClassIndex(class_names, disease_info, localized_disease_info)
+    return index
+
+def load_model_handle(version=None):
+    """Load a model version from the registry (or the unversioned files in models/) into a handle"""
+    runtime = app.config['MODEL_RUNTIME']
+    if app.config['MODEL_SERVER']:
+        # The server loads versions itself; connecting makes it pick up the registry's active one
+        model = RemoteRuntime(app.config['MODEL_SERVER'], timeout=app.config['PREDICT_TIMEOUT'])
+        return ModelHandle(model, model.class_names, model.version, f"server:{app.config['MODEL_SERVER']}",
+                           model.input_size, model.registry_version)
+    
+    version = version or model_registry.active_version()
+    if version is None:
+        # No registry yet: serve the legacy artifacts directly
+        model = load_runtime(runtime)
         with open('models/class_names.json', 'r') as f:
             class_names = json.load(f)
-        print("Model loaded successfully!")
+        # Cached predictions are only valid for the weights that produced them
+        return ModelHandle(model, class_names, runtime_version(runtime), runtime, (224, 224), None)
+    
+    manifest = model_registry.verify(version)
+    model = load_runtime(runtime, model_registry.version_dir(version))
+    return ModelHandle(model, manifest['class_names'], f"{version}/{runtime}", runtime,
+                       tuple(manifest['input_size']), version)
+
+def warm_up_model(handle):
+    """Trace the model (and the decoder) with dummy batches so the first real request doesn't"""
+    started = time.perf_counter()
+    height, width = handle.input_size
+    decode_image(WARMUP_IMAGE, (width, height))
+    for batch_size in sorted({1, app.config['BATCH_MAX_SIZE']}):
+        handle.model.predict(np.zeros((batch_size, height, width, 3), dtype=np.uint8))
+    metrics.set('model_warmup_seconds', time.perf_counter() - started)
+
+def load_ml_model(version=None, report=None):
+    """Load the trained CNN model"""
+    global model_handle
+    try:
+        # Load everything first so in-flight requests keep using the old model until the swap
+        started = time.perf_counter()
+        handle = load_model_handle(version)
+        # Build the class index before the swap so the first request doesn't pay for it
+        get_class_index(handle.class_names)
+        if app.config['MODEL_WARMUP']:
+            if report:
+                report('warming')
+            warm_up_model(handle)
+        model_handle = handle
+        metrics.set('model_load_seconds', time.perf_counter() - started)
+        metrics.set('model_loaded', 1)
+        # Only the live version: a hot reload must not leave the old one reported as served
+        metrics.replace('model_info', 1, version=handle.version)
+        registry_watcher.loaded_version = handle.registry_version
+        print(f"Model loaded successfully! (version: {handle.version})")
+        return True
     except Exception as e:
         print(f"Error loading model: {e}")
         print("Model will be trained first...")
+        return False
+
+def reload_trained_model():
+    """Swap in the model a finished training job just wrote"""
+    if not load_ml_model():
+        raise RuntimeError("could not load the newly trained model")
+    # In MODEL_SERVER mode a failed load in the server leaves it on the previous version
+    active = model_registry.active_version()
+    if active and model_handle.registry_version != active:
+        raise RuntimeError(f"still serving {model_handle.version} instead of {active}")
+
+def reload_model_version(version):
+    """Registry watcher callback: load the newly active version in the background and swap it in"""
+    print(f"Model registry switched to {version}, reloading...")
+    load_ml_model(version)
+    # Don't retry a broken version on every poll (a model server may also have failed to load it)
+    registry_watcher.loaded_version = version
+
+def load_model_in_background(report):
+    """BackgroundModelLoader entry point"""
+    load_disease_info()
+    return load_ml_model(report=report)
+
+model_loader = BackgroundModelLoader(load_model_in_background)
+
+# Tiny PNG decoded during warm-up so codec initialization is off the request path too
+WARMUP_IMAGE = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de'
+    '0000000c4944415408d763606060000000040001f61738550000000049454e44ae426082'
+)
+
+registry_watcher = RegistryWatcher(model_registry, reload_model_version,
+                                   interval=app.config['MODEL_WATCH_INTERVAL'])
+
+# Training runs in a separate process; the new model is swapped in when it finishes
+training_jobs = TrainingJobManager(app.config['TRAINING_JOBS_PATH'], on_complete=reload_trained_model)
+
+def preprocess_image_bytes(data):
+    """Preprocess encoded image bytes into a (1, 224, 224, 3) uint8 batch for model prediction"""
+    try:
+        # Decode and resize straight from the upload buffer; rescaling happens in the model
+        with metrics.timer('stage_seconds', stage='decode_resize'):
+            img = decode_image(data, (224, 224))
+        return img[np.newaxis]
+    except Exception as e:
+        print(f"Error preprocessing image: {e}")
+        return None
 
 def preprocess_image(image_path):
-    """Preprocess image for model prediction"""
+    """Preprocess image file for model prediction"""
     try:
-        # Load and resize image
-        img = cv2.imread(image_path)
-        img = cv2.resize(img, (224, 224))
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = img.astype('float32') / 255.0
-        img = np.expand_dims(img, axis=0)
-        return img
+        with open(image_path, 'rb') as f:
+            data = f.read()
     except Exception as e:
         print(f"Error preprocessing image: {e}")
         return None
+    return preprocess_image_bytes(data)
 
 def predict_disease(image_path):
-    """Predict plant disease from image"""
-    if model is None:
-        return {"error": "Model not loaded. Please train the model first."}
+    """Predict plant disease from image file"""
+    if model_handle is None:
+        return model_unavailable_error()
+    return predict_processed_image(preprocess_image(image_path))
+
+def model_unavailable_error():
+    if model_loader.state in ('loading', 'warming'):
+        return {"error": "Model is warming up, please retry shortly."}
+    return {"error": "Model not loaded. Please train the model first."}
+
+def predict_disease_bytes(data, content_hash=None):
+    """Predict plant disease from encoded image bytes, reusing cached results"""
+    handle = model_handle
+    if handle is None:
+        return model_unavailable_error()
+    if prediction_cache is None:
+        return run_prediction(preprocess_image_bytes(data), data)[0]
+    
+    content_hash = content_hash or PredictionCache.content_key(data)
+    with metrics.timer('stage_seconds', stage='cache_lookup'):
+        result = prediction_cache.get(f"{handle.version}:{content_hash}")
+    metrics.inc('prediction_cache_total', result='miss' if result is None else 'hit')
+    if result is not None:
+        return result
+    
+    processed_img = preprocess_image_bytes(data)
+    perceptual_hash = None
+    if processed_img is not None and prediction_cache.perceptual:
+        perceptual_hash = PredictionCache.perceptual_key(processed_img[0])
+        result = prediction_cache.get(f"{handle.version}:{perceptual_hash}")
+        if result is not None:
+            prediction_cache.set(f"{handle.version}:{content_hash}", result)
+            return result
     
-    processed_img = preprocess_image(image_path)
+    result, handle = run_prediction(processed_img, data)
+    if 'error' not in result:
+        # Keyed by the version that actually answered, which may be newer after a hot swap
+        prediction_cache.set(f"{handle.version}:{content_hash}", result)
+        if perceptual_hash:
+            prediction_cache.set(f"{handle.version}:{perceptual_hash}", result)
+    return result
+
+def predict_processed_image(processed_img):
+    """Predict plant disease from a preprocessed (1, 224, 224, 3) tensor"""
+    return run_prediction(processed_img)[0]
+
+def run_prediction(processed_img, data=None):
+    """Predict through the batcher; returns (result, handle of the model that produced it)
+
+    With the encoded upload in data, low-confidence predictions are refined with TTA.
+    """
     if processed_img is None:
-        return {"error": "Error processing image"}
+        return {"error": "Error processing image"}, None
     
     try:
-        # Make prediction
-        predictions = model.predict(processed_img)
-        predicted_class_idx = np.argmax(predictions[0])
-        confidence = float(predictions[0][predicted_class_idx])
-        
-        if len(class_names) > predicted_class_idx:
-            predicted_class = class_names[predicted_class_idx]
-        else:
-            predicted_class = f"Unknown_Class_{predicted_class_idx}"
-        
-        # Get disease information
-        disease_data = disease_info.get(predicted_class, {
-            "description": "Disease information not available.",
-            "symptoms": "Symptoms not documented.",
-            "remedies": ["Consult with local agricultural extension service"]
-        })
-        
-        return {
-            "disease": predicted_class,
-            "confidence": confidence,
-            "description": disease_data["description"],
-            "symptoms": disease_data["symptoms"],
-            "remedies": disease_data["remedies"]
-        }
+        # Make prediction (batched together with concurrent requests)
+        with metrics.timer('stage_seconds', stage='predict'):
+            probabilities, handle = batcher.predict(processed_img[0], timeout=app.config['PREDICT_TIMEOUT'])
+        tta_views = 0
+        if data is not None and needs_tta(probabilities):
+            with metrics.timer('stage_seconds', stage='tta'):
+                probabilities, tta_views = tta_probabilities(handle, [(data, probabilities)])[0]
+        with metrics.timer('stage_seconds', stage='format'):
+            return format_prediction(probabilities, handle.class_names, tta_views), handle
     except Exception as e:
-        return {"error": f"Prediction failed: {str(e)}"}
+        return {"error": f"Prediction failed: {str(e)}"}, None
+
+def needs_tta(probabilities):
+    return app.config['TTA'] and float(np.max(probabilities)) < app.config['TTA_THRESHOLD']
+
+def tta_probabilities(handle, rows):
+    """Average (data, probabilities) rows with the model's output on augmented views of each upload
+
+    Returns (averaged probabilities, number of views) per row. The views of every row
+    go through a single model.predict call.
+    """
+    height, width = handle.input_size
+    views = [augmented_views(data, (width, height), app.config['TTA_VIEWS']) for data, _ in rows]
+    with metrics.timer('inference_seconds'):
+        predictions = handle.model.predict(np.concatenate(views))
+    metrics.observe('batch_size', len(predictions))
+    metrics.inc('tta_total', len(rows))
+    averaged = []
+    start = 0
+    for (_, probabilities), row_views in zip(rows, views):
+        end = start + len(row_views)
+        averaged.append(((probabilities + predictions[start:end].sum(axis=0)) / (len(row_views) + 1), len(row_views)))
+        start = end
+    return averaged
+
+def format_prediction(probabilities, class_names, tta_views=0):
+    """Build the response dict for one row of model probabilities (refined with tta_views views, if any)"""
+    predicted_class_idx = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_class_idx])
+    index = get_class_index(class_names)
+    result = index.response(predicted_class_idx, confidence, app.config['DISEASE_INFO_LOCALE'])
+    top_k = np.argsort(probabilities)[::-1][:app.config['TOP_K']]
+    result['top_k'] = [{"disease": index.name(int(i)), "probability": float(probabilities[i])} for i in top_k]
+    if tta_views:
+        result['tta_views'] = tta_views
+    return result
+
+# Response keys the class index serializes ahead of time
+CLASS_INFO_KEYS = ('disease', 'confidence', 'description', 'symptoms', 'remedies')
+
+def prediction_json(result):
+    """JSON bytes of an /upload result; predictions are joined from the class index's pre-serialized info"""
+    handle = model_handle
+    index = get_class_index(handle.class_names) if handle is not None and 'error' not in result else None
+    # Cached results may name a class the current model doesn't have
+    info = index.by_name.get(result.get('disease')) if index is not None else None
+    if info is None:
+        return json.dumps(result).encode('utf-8')
+    extra = {key: value for key, value in result.items() if key not in CLASS_INFO_KEYS}
+    return index.response_json(info.index, result['confidence'], app.config['DISEASE_INFO_LOCALE'], **extra)
+
+def iter_batch_uploads(uploads):
+    """Yield (filename, bytes) for (filename, stream) uploads, expanding zip archives lazily"""
+    for filename, stream in uploads:
+        with stream:
+            if filename.lower().endswith('.zip'):
+                try:
+                    archive = zipfile.ZipFile(stream)
+                except zipfile.BadZipFile:
+                    yield filename, None
+                    continue
+                with archive:
+                    for member in archive.infolist():
+                        if member.is_dir() or not allowed_file(member.filename):
+                            continue
+                        # Refuse oversized members so a small archive cannot expand without bound
+                        if member.file_size > app.config['MAX_CONTENT_LENGTH']:
+                            yield member.filename, None
+                            continue
+                        yield member.filename, archive.read(member)
+            elif allowed_file(filename):
+                yield filename, stream.read()
+            else:
+                yield filename, None
+
+def predict_upload_batch(items):
+    """Predict one fixed-size batch of (filename, bytes) items, using the cache where possible"""
+    handle = model_handle
+    results = [None] * len(items)
+    pending = []
+    for i, (filename, data) in enumerate(items):
+        if data is None:
+            results[i] = {"error": "Invalid file type"}
+            continue
+        content_key = None
+        if prediction_cache is not None:
+            content_key = f"{handle.version}:{PredictionCache.content_key(data)}"
+            cached = prediction_cache.get(content_key)
+            if cached is not None:
+                results[i] = cached
+                continue
+        processed_img = preprocess_image_bytes(data)
+        if processed_img is None:
+            results[i] = {"error": "Error processing image"}
+            continue
+        pending.append((i, content_key, processed_img[0]))
+    
+    if pending:
+        try:
+            # The whole batch runs on the handle taken above, so cache keys stay consistent
+            images = np.stack([img for _, _, img in pending])
+            with metrics.timer('inference_seconds'):
+                predictions = list(handle.model.predict(images))
+            metrics.observe('batch_size', len(images))
+            # Low-confidence images of this batch share one augmented batch
+            retry = [j for j, probabilities in enumerate(predictions) if needs_tta(probabilities)]
+            views_used = {}
+            if retry:
+                refined = tta_probabilities(handle, [(items[pending[j][0]][1], predictions[j]) for j in retry])
+                for j, (probabilities, num_views) in zip(retry, refined):
+                    predictions[j] = probabilities
+                    views_used[j] = num_views
+            for j, ((i, content_key, _), probabilities) in enumerate(zip(pending, predictions)):
+                results[i] = format_prediction(probabilities, handle.class_names, views_used.get(j, 0))
+                if content_key is not None:
+                    prediction_cache.set(content_key, results[i])
+        except Exception as e:
+            for i, _, _ in pending:
+                results[i] = {"error": f"Prediction failed: {str(e)}"}
+    
+    for (filename, _), result in zip(items, results):
+        result['filename'] = filename
+    return results
+
+# Not in spawned helper processes (training jobs), which re-import this module as __mp_main__
+if (app.config['PRELOAD_MODEL'] or app.config['MODEL_SERVER']) and __name__ != '__mp_main__':
+    # Under gunicorn the __main__ block below never runs
+    load_disease_info()
+    load_ml_model()
+elif app.config['BACKGROUND_LOAD'] and __name__ not in ('__main__', '__mp_main__'):
+    model_loader.ensure_started()
+
+@app.before_request
+def start_request_timer():
+    request.environ['plantdoc.start'] = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = request.environ.get('plantdoc.start')
+    endpoint = request.endpoint or 'unknown'
+    # Streaming responses are timed until the first byte
+    if started is not None and endpoint != 'metrics_endpoint':
+        metrics.observe('request_seconds', time.perf_counter() - started, endpoint=endpoint)
+        metrics.inc('requests_total', endpoint=endpoint, status=response.status_code)
+    return response
+
+@app.before_request
+def start_model_loader():
+    if model_handle is None:
+        model_loader.ensure_started()
+
+@app.before_request
+def start_upload_sweeper():
+    if app.config['SAVE_UPLOADS']:
+        upload_store.ensure_started()
+
+@app.before_request
+def start_registry_watcher():
+    # In MODEL_SERVER mode this only refreshes the worker's labels after the server switches versions
+    registry_watcher.ensure_started()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def process_upload(filename, data):
+    """Predict an uploaded image and store it; shared by the WSGI and ASGI /upload handlers"""
+    extension = filename.rsplit('.', 1)[1].lower()
+    with metrics.timer('stage_seconds', stage='hash'):
+        content_hash = PredictionCache.content_key(data)
+    
+    # Predict disease from the in-memory upload
+    result = predict_disease_bytes(data, content_hash)
+    if 'error' in result:
+        metrics.inc('errors_total', endpoint='upload')
+    
+    # Failed predictions (e.g. undecodable files) are not kept
+    if app.config['SAVE_UPLOADS'] and 'error' not in result:
+        # Content-addressed names: re-uploads of the same photo share one file
+        try:
+            with metrics.timer('stage_seconds', stage='save'):
+                stored = upload_store.save(data, content_hash, extension)
+        except Exception as e:
+            print(f"Could not store upload: {e}")
+            return result
+        # Copied first: the result may be the cache's shared dict
+        result = dict(result, image_path=stored.thumbnail_url or stored.url)
+        if stored.url:
+            result['original_path'] = stored.url
+    return result
+
+@app.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    """Stored uploads and thumbnails; names are content hashes, so they never change"""
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=365 * 86400)
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
+    # Parsing the multipart body is where the upload is received
+    with metrics.timer('stage_seconds', stage='receive'):
+        files = request.files
+    if 'file' not in files:
         return jsonify({'error': 'No file uploaded'})
     
-    file = request.files['file']
+    file = files['file']
     if file.filename == '':
         return jsonify({'error': 'No file selected'})
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add timestamp to filename to avoid conflicts
-        import time
-        timestamp = str(int(time.time()))
-        filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        # Predict disease
-        result = predict_disease(file_path)
-        result['image_path'] = f"static/uploads/{filename}"
-        
-        return jsonify(result)
+        return Response(prediction_json(process_upload(file.filename, file.read())), mimetype='application/json')
     
     return jsonify({'error': 'Invalid file type'})
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """Score many images (or zip archives of images), streaming NDJSON per batch"""
+    # Bulk uploads are allowed to exceed the single-image limit
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+    if model_handle is None:
+        return jsonify(model_unavailable_error()), 503
+    
+    # Take ownership of the spooled upload streams: the request context closes
+    # its file objects when the view returns, before the response has streamed
+    uploads = [(file.filename, file.stream) for file in files]
+    for file in files:
+        file.stream = io.BytesIO()
+    batch_size = app.config['PREDICT_BATCH_SIZE']
+    
+    def emit(batch, start):
+        # One NDJSON chunk per completed batch
+        results = predict_upload_batch(batch)
+        errors = sum('error' in result for result in results)
+        if errors:
+            metrics.inc('errors_total', errors, endpoint='predict_batch')
+        return ''.join(json.dumps(dict(result, index=start + i)) + '\n' for i, result in enumerate(results))
+    
+    def generate():
+        index = 0
+        batch = []
+        for item in iter_batch_uploads(uploads):
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield emit(batch, index)
+                index += len(batch)
+                batch = []
+        if batch:
+            yield emit(batch, index)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/train_model')
 def train_model_route():
-    """Route to trigger model training"""
-    from train_model import train_cnn_model
+    """Start model training in a background process and return its job ID
+    
+    ?mode=finetune continues from the production model on newly added images instead
+    of training from scratch.
+    """
+    mode = request.args.get('mode', 'full')
+    if mode == 'finetune':
+        options = {}
+    elif mode == 'full':
+        options = {'shard_dir': app.config['TRAINING_SHARDS'], 'architecture': app.config['TRAINING_ARCHITECTURE']}
+    else:
+        return jsonify({'error': "mode must be 'full' or 'finetune'"}), 400
     try:
-        train_cnn_model()
-        load_ml_model()  # Reload the newly trained model
-        return jsonify({'success': 'Model trained successfully!'})
+        job, started = training_jobs.start(mode=mode, **options)
     except Exception as e:
         return jsonify({'error': f'Training failed: {str(e)}'})
+    return jsonify(dict(
+        job.to_dict(),
+        message='Training started' if started else 'Training already in progress',
+        status_url=url_for('train_status', job_id=job.id),
+        stream_url=url_for('train_stream', job_id=job.id)
+    )), 202
+
+@app.route('/train_status/<job_id>')
+def train_status(job_id):
+    """Current state and latest progress of a training job"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown training job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/train_stream/<job_id>')
+def train_stream(job_id):
+    """Server-sent events with a training job's progress, ending when the job finishes
+    
+    The stream holds a worker for the whole run, so it needs threaded or async
+    workers; the page polls /train_status instead.
+    """
+    if training_jobs.get(job_id) is None:
+        return jsonify({'error': 'Unknown training job'}), 404
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        last_seq = -1
+    
+    def generate():
+        seq = last_seq
+        while True:
+            events = training_jobs.events_after(job_id, seq)
+            if not events:
+                job = training_jobs.get(job_id)
+                if job is None or job.status in TERMINAL_STATES:
+                    return
+                # Keep-alive comment so proxies don't drop an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            for event in events:
+                seq = event['seq']
+                yield f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                if event['event'] in TERMINAL_STATES:
+                    return
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/model_status')
 def model_status():
     """Check if model is loaded"""
+    handle = model_handle
     return jsonify({
-        'model_loaded': model is not None,
-        'num_classes': len(class_names) if class_names else 0
+        'model_loaded': handle is not None,
+        # Same as /ready: a loaded model has been warmed up before it was swapped in
+        'ready': handle is not None,
+        'startup': 'ready' if handle is not None else model_loader.state,
+        'startup_error': model_loader.error,
+        'model_version': handle.version if handle else None,
+        'registry_version': handle.registry_version if handle else None,
+        'runtime': handle.runtime if handle else app.config['MODEL_RUNTIME'],
+        'model_server': app.config['MODEL_SERVER'] or None,
+        'pinned_version': model_registry.pinned_version(),
+        'num_classes': len(handle.class_names) if handle else 0
     })
 
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once this worker can serve predictions, 503 while loading or warming"""
+    if model_handle is None:
+        return jsonify({'ready': False, 'startup': model_loader.state}), 503
+    return jsonify({'ready': True, 'startup': 'ready'})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics aggregated over all workers"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/inference_stats')
+def inference_stats():
+    """Report micro-batching queue depth and batch-size statistics"""
+    stats = batcher.stats()
+    if prediction_cache is not None:
+        stats['prediction_cache'] = prediction_cache.stats()
+    return jsonify(stats)
+
+metrics.set('import_seconds', time.perf_counter() - IMPORT_STARTED)
+
 if __name__ == '__main__':
     # Load disease information
     load_disease_info()
@@ -1,13 +1,16 @@
 import os
 import json
+import hashlib
+import zlib
 import numpy as np
 import random
 import time
-from flask import Flask, request, render_template, jsonify, redirect, url_for
+from flask import Flask, Response, request, render_template, jsonify, redirect, url_for, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from PIL import Image
-import cv2
+import color_analysis
+from class_index import ClassIndex, load_localized_info
+from upload_store import UploadStore
 
 app = Flask(__name__)
 CORS(app)
@@ -17,12 +20,35 @@ app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
+# Colour analysis runs on an image downscaled to this longer side during decode (0 = full size)
+app.config['COLOR_ANALYSIS_MAX_SIDE'] = int(os.environ.get('COLOR_ANALYSIS_MAX_SIDE', 256))
+
+# Simulated model latency: none, fixed:<s>, uniform:<low>,<high> or lognormal:<median>,<sigma>
+app.config['DEMO_LATENCY'] = os.environ.get('DEMO_LATENCY', 'none')
+app.config['DEMO_TRAIN_LATENCY'] = os.environ.get('DEMO_TRAIN_LATENCY', 'none')
+# Sampled latencies are only reported by default; 1 = also sleep for them, which ties up a sync
+# worker for the whole wait (it yields only under gevent/eventlet workers)
+app.config['DEMO_LATENCY_SLEEP'] = os.environ.get('DEMO_LATENCY_SLEEP', '0') == '1'
+# Seed for repeatable predictions: the same image always gets the same result (unset = random)
+app.config['DEMO_SEED'] = os.environ.get('DEMO_SEED')
+
+# Language of disease descriptions/remedies, from data/disease_info.<locale>.json ('' = default file)
+app.config['DISEASE_INFO_LOCALE'] = os.environ.get('DISEASE_INFO_LOCALE') or None
+
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Same retention settings as app.py; the demo keeps originals because it analyses them from disk
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    max_bytes=int(os.environ.get('UPLOAD_MAX_BYTES', 1024 ** 3)),
+    max_age=float(os.environ.get('UPLOAD_MAX_AGE', 7 * 86400))
+)
+
 # Global variables for model and class names
 model_loaded = True  # Simulate model is always loaded in demo
-class_names = [
+# Used when models/class_names.json is missing
+DEFAULT_CLASS_NAMES = [
     "Apple___Apple_scab",
     "Apple___Black_rot", 
     "Apple___Cedar_apple_rust",
@@ -32,11 +58,28 @@ class_names = [
     "Corn_(maize)___Northern_Leaf_Blight", 
     "Corn_(maize)___healthy"
 ]
+class_names = DEFAULT_CLASS_NAMES
 disease_info = {}
+class_index = None
+# Conditions the colour heuristic treats as spot/blight-like lesions
+SPOT_WORDS = ('spot', 'blight', 'scab')
+# (base, spread) of healthy and diseased confidence for crops recognized from the filename
+CROP_CONFIDENCE = {'Apple': ((0.85, 0.1), (0.78, 0.15)), 'Corn_(maize)': ((0.87, 0.08), (0.75, 0.18))}
+DEFAULT_CROP_CONFIDENCE = ((0.85, 0.1), (0.78, 0.15))
+spot_diseases = []
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def load_class_names():
+    """Load the class list the real model was trained on"""
+    global class_names
+    try:
+        with open('models/class_names.json', 'r') as f:
+            class_names = json.load(f)
+    except FileNotFoundError:
+        class_names = DEFAULT_CLASS_NAMES
+
 def load_disease_info():
     """Load disease information and remedies"""
     global disease_info
@@ -128,99 +171,108 @@ def load_disease_info():
             }
         }
 
+def build_class_index():
+    """Index class metadata once so predictions don't scan class_names per request"""
+    global class_index, spot_diseases
+    class_index = ClassIndex(class_names, disease_info, load_localized_info('data/disease_info.json'))
+    spot_diseases = class_index.matching(SPOT_WORDS)
+
+def parse_latency(spec):
+    """Turn a DEMO_LATENCY spec into a function rng -> seconds"""
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',')] if params else []
+    if kind == 'none':
+        return lambda rng: 0.0
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda rng: rng.lognormvariate(np.log(values[0]), values[1])
+    raise ValueError(f"Invalid latency spec {spec!r}")
+
+
+prediction_latency = parse_latency(app.config['DEMO_LATENCY'])
+train_latency = parse_latency(app.config['DEMO_TRAIN_LATENCY'])
+
+
+def simulate_latency(latency, rng=random):
+    """Sample a latency and, if DEMO_LATENCY_SLEEP is on, wait it out; returns the seconds"""
+    seconds = latency(rng)
+    if seconds > 0 and app.config['DEMO_LATENCY_SLEEP']:
+        time.sleep(seconds)
+    return seconds
+
+
+def prediction_rng(image_path):
+    """Random source for one prediction: seeded by DEMO_SEED and the image bytes, else the global one"""
+    seed = app.config['DEMO_SEED']
+    if seed is None:
+        return random
+    with open(image_path, 'rb') as f:
+        return random.Random(f"{seed}:{zlib.crc32(f.read())}")
+
+
 def analyze_image_color(image_path):
     """Analyze image colors to make an educated guess about plant health"""
     try:
-        img = cv2.imread(image_path)
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Convert to HSV for better color analysis
-        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-        
-        # Define color ranges for different conditions
-        # Green (healthy)
-        lower_green = np.array([40, 30, 30])
-        upper_green = np.array([80, 255, 255])
-        green_mask = cv2.inRange(hsv, lower_green, upper_green)
-        green_ratio = np.sum(green_mask > 0) / (img.shape[0] * img.shape[1])
-        
-        # Brown/Yellow (diseased)
-        lower_brown = np.array([10, 50, 50])
-        upper_brown = np.array([30, 255, 255])
-        brown_mask = cv2.inRange(hsv, lower_brown, upper_brown)
-        brown_ratio = np.sum(brown_mask > 0) / (img.shape[0] * img.shape[1])
-        
-        return green_ratio, brown_ratio
+        features = color_analysis.analyze(image_path, app.config['COLOR_ANALYSIS_MAX_SIDE'] or None)
+        return float(features[0]), float(features[1])  # green_ratio, brown_ratio
     except:
         return 0.5, 0.3  # Default values
 
-def simulate_cnn_prediction(image_path):
+def simulate_cnn_prediction(image_path, rng=random, filename=None):
     """Simulate CNN model prediction based on image analysis"""
     # Analyze image colors
     green_ratio, brown_ratio = analyze_image_color(image_path)
     
-    # Extract filename to make educated guesses
-    filename = os.path.basename(image_path).lower()
+    # Extract filename to make educated guesses (stored uploads are named by hash)
+    crop = class_index.crop_for(filename or os.path.basename(image_path))
     
     # Base probabilities for different conditions
     if green_ratio > 0.3 and brown_ratio < 0.2:
         # Likely healthy
-        if 'apple' in filename:
-            predicted_class = "Apple___healthy"
-            confidence = 0.85 + random.uniform(0, 0.1)
-        elif 'corn' in filename or 'maize' in filename:
-            predicted_class = "Corn_(maize)___healthy"
-            confidence = 0.87 + random.uniform(0, 0.08)
+        crop_healthy = [c for c in class_index.crops.get(crop, []) if c.healthy]
+        if crop_healthy:
+            predicted_class = crop_healthy[0]
+            base, spread = CROP_CONFIDENCE.get(crop, DEFAULT_CROP_CONFIDENCE)[0]
+            confidence = base + rng.uniform(0, spread)
         else:
             # Random healthy class
-            healthy_classes = [c for c in class_names if 'healthy' in c]
-            predicted_class = random.choice(healthy_classes)
-            confidence = 0.82 + random.uniform(0, 0.12)
+            predicted_class = rng.choice(class_index.healthy)
+            confidence = 0.82 + rng.uniform(0, 0.12)
     else:
         # Likely diseased
-        if 'apple' in filename:
-            disease_classes = [c for c in class_names if 'Apple' in c and 'healthy' not in c]
-            predicted_class = random.choice(disease_classes)
-            confidence = 0.78 + random.uniform(0, 0.15)
-        elif 'corn' in filename or 'maize' in filename:
-            disease_classes = [c for c in class_names if 'Corn' in c and 'healthy' not in c]
-            predicted_class = random.choice(disease_classes)
-            confidence = 0.75 + random.uniform(0, 0.18)
+        crop_diseases = [c for c in class_index.crops.get(crop, []) if not c.healthy]
+        if crop_diseases:
+            predicted_class = rng.choice(crop_diseases)
+            base, spread = CROP_CONFIDENCE.get(crop, DEFAULT_CROP_CONFIDENCE)[1]
+            confidence = base + rng.uniform(0, spread)
         else:
             # Random disease class based on color analysis
-            if brown_ratio > 0.3:
+            if brown_ratio > 0.3 and spot_diseases:
                 # More likely to be a spot/blight disease
-                spot_diseases = [c for c in class_names if any(word in c.lower() for word in ['spot', 'blight', 'scab'])]
-                predicted_class = random.choice(spot_diseases) if spot_diseases else random.choice(class_names)
+                predicted_class = rng.choice(spot_diseases)
             else:
-                predicted_class = random.choice(class_names)
-            confidence = 0.72 + random.uniform(0, 0.2)
+                predicted_class = rng.choice(class_index.classes)
+            confidence = 0.72 + rng.uniform(0, 0.2)
     
-    return predicted_class, min(confidence, 0.98)  # Cap confidence at 98%
+    return predicted_class.name, min(confidence, 0.98)  # Cap confidence at 98%
+
+def run_simulated_prediction(image_path, filename=None):
+    """Simulated latency plus prediction; returns (class index, confidence, latency)"""
+    rng = prediction_rng(image_path)
+    latency = simulate_latency(prediction_latency, rng)
+    predicted_class, confidence = simulate_cnn_prediction(image_path, rng, filename)
+    return class_index.by_name[predicted_class].index, confidence, latency
 
 def predict_disease(image_path):
     """Predict plant disease from image using simulated CNN"""
     try:
-        # Simulate processing time
-        time.sleep(random.uniform(1, 3))
-        
-        # Simulate CNN prediction
-        predicted_class, confidence = simulate_cnn_prediction(image_path)
-        
-        # Get disease information
-        disease_data = disease_info.get(predicted_class, {
-            "description": "Disease information not available.",
-            "symptoms": "Symptoms not documented.",
-            "remedies": ["Consult with local agricultural extension service"]
-        })
-        
-        return {
-            "disease": predicted_class,
-            "confidence": confidence,
-            "description": disease_data["description"],
-            "symptoms": disease_data["symptoms"],
-            "remedies": disease_data["remedies"]
-        }
+        index, confidence, latency = run_simulated_prediction(image_path)
+        result = class_index.response(index, confidence, app.config['DISEASE_INFO_LOCALE'])
+        result['simulated_latency'] = latency
+        return result
     except Exception as e:
         return {"error": f"Prediction failed: {str(e)}"}
 
@@ -228,6 +280,17 @@ def predict_disease(image_path):
 def index():
     return render_template('index.html')
 
+@app.before_request
+def start_upload_sweeper():
+    upload_store.ensure_started()
+
+@app.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    """Stored uploads and thumbnails; names are content hashes, so they never change"""
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=365 * 86400)
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -239,18 +302,24 @@ def upload_file():
     
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        # Add timestamp to filename to avoid conflicts
-        import time
-        timestamp = str(int(time.time()))
-        filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        data = file.read()
+        # Content-addressed name, so uploads never overwrite each other
+        try:
+            stored = upload_store.save(data, hashlib.sha256(data).hexdigest(), filename.rsplit('.', 1)[1].lower())
+            if stored.saved:
+                stored.saved.result()
+        except Exception as e:
+            return jsonify({"error": f"Could not store upload: {str(e)}"})
         
-        # Predict disease
-        result = predict_disease(file_path)
-        result['image_path'] = f"static/uploads/{filename}"
-        
-        return jsonify(result)
+        # Predict disease; the response is joined from pre-serialized class info
+        try:
+            index, confidence, latency = run_simulated_prediction(stored.path, filename)
+        except Exception as e:
+            return jsonify({"error": f"Prediction failed: {str(e)}"})
+        body = class_index.response_json(index, confidence, app.config['DISEASE_INFO_LOCALE'],
+                                         simulated_latency=latency, image_path=stored.thumbnail_url,
+                                         original_path=stored.url)
+        return Response(body, mimetype='application/json')
     
     return jsonify({'error': 'Invalid file type'})
 
@@ -258,8 +327,7 @@ def upload_file():
 def train_model_route():
     """Simulate model training"""
     try:
-        # Simulate training time
-        time.sleep(random.uniform(2, 5))
+        simulate_latency(train_latency)
         return jsonify({'success': 'Demo model is ready! (This is a simulation for demonstration purposes)'})
     except Exception as e:
         return jsonify({'error': f'Training simulation failed: {str(e)}'})
@@ -274,10 +342,12 @@ def model_status():
         'message': 'Running in demo mode with simulated AI predictions'
     })
 
+# Built at import so gunicorn workers have them too
+load_class_names()
+load_disease_info()
+build_class_index()
+
 if __name__ == '__main__':
-    # Load disease information
-    load_disease_info()
-    
     print("=" * 60)
     print("🌱 PlantDoc AI - Demo Mode")
     print("=" * 60)
@@ -0,0 +1,136 @@
+"""
+ASGI serving mode: the same routes as app.py, but /upload bodies are received on an
+event loop, so a slow mobile upload holds a socket instead of a worker thread.
+Decode and inference run on a bounded thread pool. When too many predictions are
+already in flight, new uploads get HTTP 429 with Retry-After instead of queueing.
+
+Every other route (/, /model_status, /train_model, /predict_batch, /metrics, static
+files) is served by the Flask app mounted underneath.
+
+Usage:
+    pip install starlette python-multipart uvicorn
+    uvicorn asgi_app:app --workers 4 --host 0.0.0.0 --port 5000
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:5000 asgi_app:app
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import app as core
+
+# Threads for decode + waiting on the micro-batcher; inference itself is batched
+ASYNC_WORKER_THREADS = int(os.environ.get('ASYNC_WORKER_THREADS', os.cpu_count() or 4))
+# Predictions allowed in flight per worker before uploads are rejected with 429
+ASYNC_MAX_PENDING = int(os.environ.get('ASYNC_MAX_PENDING', 64))
+
+executor = ThreadPoolExecutor(max_workers=ASYNC_WORKER_THREADS, thread_name_prefix='asgi-inference')
+pending = 0
+
+core.metrics.declare('rejected_total', 'counter', 'Uploads rejected with 429 because the inference queue was full')
+
+
+def busy_response():
+    core.metrics.inc('rejected_total')
+    return JSONResponse({'error': 'Server busy, please retry shortly'}, status_code=429,
+                        headers={'Retry-After': '1'})
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def limited_receive(receive, limit):
+    """Wrap an ASGI receive callable to raise BodyTooLarge once more than limit body bytes arrive"""
+    received = 0
+
+    async def wrapped():
+        nonlocal received
+        message = await receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise BodyTooLarge()
+        return message
+    return wrapped
+
+
+async def upload(request):
+    global pending
+    started = time.perf_counter()
+    limit = core.app.config['MAX_CONTENT_LENGTH']
+    try:
+        length = int(request.headers.get('content-length') or 0)
+    except ValueError:
+        return JSONResponse({'error': 'Invalid Content-Length'}, status_code=400)
+    if length > limit:
+        return JSONResponse({'error': 'File too large'}, status_code=413)
+    # Content-Length is optional (chunked uploads), so the body is counted as it arrives too
+    request = Request(request.scope, limited_receive(request.receive, limit))
+    # Reject before receiving the body, so an overloaded worker doesn't spool uploads
+    queue_depth = core.batcher.stats()['queue_depth']
+    if pending >= ASYNC_MAX_PENDING or queue_depth >= core.batcher.max_queue_size:
+        return busy_response()
+    if core.model_handle is None:
+        return JSONResponse(core.model_unavailable_error(), status_code=503, headers={'Retry-After': '5'})
+
+    try:
+        with core.metrics.timer('stage_seconds', stage='receive'):
+            form = await request.form(max_files=1)
+    except BodyTooLarge:
+        return JSONResponse({'error': 'File too large'}, status_code=413)
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        return JSONResponse({'error': 'No file uploaded'})
+    if file.filename == '':
+        return JSONResponse({'error': 'No file selected'})
+    if not core.allowed_file(file.filename):
+        return JSONResponse({'error': 'Invalid file type'})
+    data = await file.read()
+    await form.close()
+
+    # Checked again: other uploads may have filled the pool while this body arrived
+    if pending >= ASYNC_MAX_PENDING:
+        return busy_response()
+    pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(executor, core.process_upload, file.filename, data)
+    finally:
+        pending -= 1
+    core.metrics.observe('request_seconds', time.perf_counter() - started, endpoint='upload_file')
+    core.metrics.inc('requests_total', endpoint='upload_file', status=200)
+    return Response(core.prediction_json(result), media_type='application/json')
+
+
+@asynccontextmanager
+async def lifespan(_):
+    # Runs in each worker after it starts; the model loads and warms up in the background
+    if core.model_handle is None:
+        core.model_loader.ensure_started()
+    if core.app.config['SAVE_UPLOADS']:
+        core.upload_store.ensure_started()
+    if not core.app.config['MODEL_SERVER']:
+        core.registry_watcher.ensure_started()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/upload', upload, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(core.app)),
+    ],
+    lifespan=lifespan
+)
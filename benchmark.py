@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Reproducible load-testing and micro-benchmark harness for the inference service.
+
+Results are written as JSON (tagged with the git commit) so runs can be compared
+across commits.
+
+Usage:
+    python benchmark.py corpus                          # generate the seeded image corpus
+    python benchmark.py load --serve auto --concurrency 1 4 16
+    python benchmark.py load --url http://localhost:5000 --server-pid 1234
+    python benchmark.py micro                           # includes colour-analysis parity vs. the original
+    python benchmark.py startup --serve auto            # import time, time-to-ready, first prediction
+    python benchmark.py all --output results/bench.json
+    python benchmark.py compare results/old.json results/new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# (width, height): model-sized, small/medium phone uploads and a 12 MP photo
+CORPUS_SIZES = [(224, 224), (640, 480), (1280, 960), (4032, 3024)]
+CORPUS_FORMATS = ['jpg', 'png']
+
+
+def synthetic_leaf(width, height, rng):
+    """Green leaf-like texture with brown lesions, cheap to generate at any size"""
+    base = rng.integers(0, 60, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    img = np.asarray(Image.fromarray(base).resize((width, height), Image.BILINEAR)).copy()
+    img[..., 1] = np.clip(img[..., 1].astype(np.int16) + 110, 0, 255)
+    for _ in range(rng.integers(2, 8)):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        r = max(4, min(width, height) // rng.integers(10, 30))
+        img[max(0, y - r):y + r, max(0, x - r):x + r] = (120, 80, 30)
+    return img
+
+
+def generate_corpus(output='results/bench_corpus', per_size=5, seed=0):
+    """Write per_size images for every size and format; returns the file paths"""
+    os.makedirs(output, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for width, height in CORPUS_SIZES:
+        for i in range(per_size):
+            img = Image.fromarray(synthetic_leaf(width, height, rng))
+            for fmt in CORPUS_FORMATS:
+                path = os.path.join(output, f"leaf_{width}x{height}_{i}.{fmt}")
+                if not os.path.exists(path):
+                    # quality only applies to JPEG; PNG ignores it
+                    img.save(path, quality=90)
+                paths.append(path)
+    return paths
+
+
+def load_corpus(output='results/bench_corpus', per_size=5, seed=0):
+    paths = generate_corpus(output, per_size, seed)
+    corpus = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            corpus.append((os.path.basename(path), f.read()))
+    return corpus
+
+
+def latency_summary(latencies, elapsed=None):
+    """p50/p95/p99/mean in milliseconds, plus throughput when elapsed is given"""
+    if not latencies:
+        return {'count': 0}
+    ms = np.asarray(latencies) * 1000.0
+    summary = {
+        'count': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max())
+    }
+    if elapsed:
+        summary['throughput_per_s'] = len(ms) / elapsed
+    return summary
+
+
+def process_tree_peak_rss_mb(pid):
+    """Peak RSS (VmHWM) of pid and its children, from /proc (Linux only)"""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024.0 if total else None
+
+
+def has_trained_model():
+    return os.path.exists('models/plant_disease_model.h5') or os.path.exists('models/registry/CURRENT')
+
+
+class ServerProcess:
+    """Start app:app (or app_demo:app) under gunicorn on a local port"""
+
+    def __init__(self, module, port=5055, workers=2, threads=8, env=None):
+        self.module = module
+        self.url = f"http://127.0.0.1:{port}"
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+                   '-b', f"127.0.0.1:{port}", f"{module}:app"]
+        self.process = subprocess.Popen(command, env=dict(os.environ, **(env or {})),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_ready(self, session, timeout=120):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                # app reports 'ready' once the model is loaded and warmed up; app_demo always is
+                response = session.get(f"{self.url}/model_status", timeout=2)
+                if response.ok and response.json().get('ready', True):
+                    return
+            except Exception:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise SystemExit(f"{self.module} did not start within {timeout}s")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def run_load(url, corpus, concurrency, num_requests, endpoint='upload', batch_size=16):
+    """Fire num_requests requests at concurrency; returns latency/throughput/error stats"""
+    import requests
+
+    def one(i):
+        session = requests.Session()
+        if endpoint == 'upload':
+            name, data = corpus[i % len(corpus)]
+            files = {'file': (name, data)}
+            target = f"{url}/upload"
+        else:
+            items = [corpus[(i * batch_size + j) % len(corpus)] for j in range(batch_size)]
+            files = [('files', (name, data)) for name, data in items]
+            target = f"{url}/predict_batch"
+        start = time.perf_counter()
+        try:
+            response = session.post(target, files=files, timeout=120)
+            ok = response.ok and '"error"' not in response.text
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        # Warm-up so connection setup and first-request tracing don't skew the numbers
+        list(pool.map(one, range(min(concurrency, num_requests))))
+        start = time.perf_counter()
+        outcomes = list(pool.map(one, range(num_requests)))
+        elapsed = time.perf_counter() - start
+    latencies = [latency for latency, ok in outcomes if ok]
+    result = latency_summary(latencies, elapsed)
+    result.update({'endpoint': endpoint, 'concurrency': concurrency, 'requests': num_requests,
+                   'errors': sum(not ok for _, ok in outcomes)})
+    if endpoint != 'upload':
+        result['images_per_s'] = len(latencies) * batch_size / elapsed
+    return result
+
+
+def load_benchmarks(args, corpus):
+    import requests
+    server = None
+    url = args.url
+    pid = args.server_pid
+    module = args.serve
+    if module == 'auto':
+        module = 'app' if has_trained_model() else 'app_demo'
+    if module:
+        # Load the model at import in every worker, and measure inference rather than cache hits
+        env = {'PRELOAD_MODEL': '1', 'PREDICTION_CACHE': 'memory' if args.cache else 'off'}
+        # The demo app's simulated model: no injected latency and repeatable predictions
+        env.update({'DEMO_LATENCY': 'none', 'DEMO_SEED': str(args.seed)})
+        server = ServerProcess(module, args.port, args.workers, env=env)
+        server.wait_ready(requests.Session())
+        url, pid = server.url, server.process.pid
+    results = {'url': url, 'server': module, 'runs': []}
+    try:
+        for concurrency in args.concurrency:
+            results['runs'].append(run_load(url, corpus, concurrency, args.requests))
+            if module != 'app_demo':
+                results['runs'].append(run_load(url, corpus, concurrency, max(1, args.requests // 8),
+                                                endpoint='predict_batch'))
+        if pid:
+            results['server_peak_rss_mb'] = process_tree_peak_rss_mb(pid)
+    finally:
+        if server:
+            server.stop()
+    return results
+
+
+def startup_benchmarks(args, corpus, repeat=3):
+    """Import time of the app module, and server time-to-ready and first-prediction latency"""
+    import requests
+    module = args.serve or 'auto'
+    if module == 'auto':
+        module = 'app' if has_trained_model() else 'app_demo'
+    script = (f"import time; started = time.perf_counter(); import {module}; "
+              f"print(time.perf_counter() - started)")
+    import_seconds = [float(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                           check=True).stdout.split()[-1]) for _ in range(repeat)]
+    results = {'server': module, 'import_s': {'min': min(import_seconds), 'mean': float(np.mean(import_seconds))}}
+
+    # The model loads in the background at worker start, as in production
+    started = time.perf_counter()
+    server = ServerProcess(module, args.port, workers=1,
+                           env={'BACKGROUND_LOAD': '1', 'PREDICTION_CACHE': 'off', 'DEMO_SEED': str(args.seed)})
+    try:
+        session = requests.Session()
+        server.wait_ready(session)
+        results['time_to_ready_s'] = time.perf_counter() - started
+        name, data = corpus[0]
+        first = time.perf_counter()
+        response = session.post(f"{server.url}/upload", files={'file': (name, data)}, timeout=120)
+        results['first_prediction_ms'] = (time.perf_counter() - first) * 1000
+        results['first_prediction_ok'] = response.ok and 'error' not in response.json()
+        results['steady_prediction'] = time_function(
+            lambda: session.post(f"{server.url}/upload", files={'file': (name, data)}, timeout=120), repeat=10)
+    finally:
+        server.stop()
+    return results
+
+
+def time_function(fn, repeat=20, warmup=2):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def micro_benchmarks(corpus, corpus_dir, repeat=20):
+    """preprocess_image per corpus size, model.predict per batch size, analyze_image_color"""
+    results = {}
+    import app
+    import app_demo
+    import color_analysis
+
+    by_size = {}
+    for name, data in corpus:
+        by_size.setdefault(name.split('_')[1] + '.' + name.rsplit('.', 1)[1], (name, data))
+    results['preprocess_image'] = {
+        key: time_function(lambda data=data: app.preprocess_image_bytes(data), repeat)
+        for key, (_, data) in sorted(by_size.items())
+    }
+    results['analyze_image_color'] = {
+        key: time_function(lambda name=name: app_demo.analyze_image_color(os.path.join(corpus_dir, name)), repeat)
+        for key, (name, _) in sorted(by_size.items())
+    }
+    results['analyze_image_color_reference'] = {
+        key: time_function(lambda name=name: color_analysis.reference_color_ratios(os.path.join(corpus_dir, name)),
+                           repeat)
+        for key, (name, _) in sorted(by_size.items())
+    }
+    # Largest green/brown ratio difference between the downscaled engine and the full-size original
+    paths = [os.path.join(corpus_dir, name) for name, _ in corpus]
+    fast = color_analysis.analyze_batch(paths, app_demo.app.config['COLOR_ANALYSIS_MAX_SIDE'] or None)[:, :2]
+    reference = np.array([color_analysis.reference_color_ratios(path) for path in paths])
+    results['color_ratio_max_abs_diff'] = float(np.abs(fast - reference).max())
+
+    if has_trained_model() and app.load_ml_model():
+        model = app.model_handle.model
+        results['model_predict'] = {}
+        for batch_size in (1, 8, 32):
+            batch = np.random.default_rng(0).integers(0, 256, (batch_size, 224, 224, 3), dtype=np.uint8)
+            summary = time_function(lambda: model.predict(batch), max(3, repeat // batch_size))
+            summary['per_image_ms'] = summary['mean_ms'] / batch_size
+            results['model_predict'][str(batch_size)] = summary
+    else:
+        results['model_predict'] = None
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'timestamp': time.time(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def compare(old_path, new_path):
+    """Print mean/p95 changes between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def flatten(node, prefix=''):
+        if isinstance(node, dict):
+            if 'p95_ms' in node:
+                yield prefix, node
+            for key, value in node.items():
+                yield from flatten(value, f"{prefix}/{key}" if prefix else key)
+        elif isinstance(node, list):
+            for item in node:
+                if isinstance(item, dict) and 'endpoint' in item:
+                    yield from flatten(item, f"{prefix}/{item['endpoint']}@{item['concurrency']}")
+
+    old_stats = dict(flatten(old))
+    for key, stats in flatten(new):
+        if key in old_stats:
+            for metric in ('mean_ms', 'p95_ms'):
+                before, after = old_stats[key][metric], stats[metric]
+                change = (after - before) / before * 100 if before else 0.0
+                print(f"{key:60s} {metric:8s} {before:9.2f} -> {after:9.2f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the plant disease inference service")
+    parser.add_argument('command', choices=['corpus', 'load', 'micro', 'startup', 'all', 'compare'])
+    parser.add_argument('files', nargs='*', help="Two result files for compare")
+    parser.add_argument('--corpus-dir', default='results/bench_corpus')
+    parser.add_argument('--per-size', type=int, default=5, help="Images per size in the corpus")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', default='http://localhost:5000', help="Running server to load-test")
+    parser.add_argument('--server-pid', type=int, default=None, help="Server pid, for peak RSS")
+    parser.add_argument('--serve', choices=['auto', 'app', 'app_demo'], default=None,
+                        help="Start the server under gunicorn; auto uses app_demo when no model is trained")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--cache', action='store_true', help="Keep the prediction cache on in --serve mode")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument('--repeat', type=int, default=20, help="Repetitions per micro-benchmark")
+    parser.add_argument('--output', default=None, help="JSON results file (default results/bench-<commit>.json)")
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        if len(args.files) != 2:
+            parser.error("compare needs two result files")
+        compare(*args.files)
+        return
+    corpus = load_corpus(args.corpus_dir, args.per_size, args.seed)
+    if args.command == 'corpus':
+        print(f"{len(corpus)} images in {args.corpus_dir}")
+        return
+
+    results = {'environment': environment()}
+    if args.command in ('load', 'all'):
+        results['load'] = load_benchmarks(args, corpus)
+    if args.command in ('micro', 'all'):
+        results['micro'] = micro_benchmarks(corpus, args.corpus_dir, args.repeat)
+    if args.command == 'startup' or (args.command == 'all' and args.serve):
+        results['startup'] = startup_benchmarks(args, corpus)
+    results['client_peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    output = args.output or f"results/bench-{results['environment']['commit'] or 'local'}-{int(time.time())}.json"
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import glob
+import json
+import os
+import re
+from collections import namedtuple
+
+# Used for classes the disease info file doesn't cover
+DEFAULT_INFO = {
+    "description": "Disease information not available.",
+    "symptoms": "Symptoms not documented.",
+    "remedies": ["Consult with local agricultural extension service"]
+}
+
+# PlantVillage names are "<crop>___<condition>", e.g. "Corn_(maize)___Common_rust"
+ClassInfo = namedtuple('ClassInfo', ['index', 'name', 'crop', 'condition', 'healthy', 'keywords'])
+
+
+def parse_class_name(index, name):
+    """Split a PlantVillage class name into its crop, condition and healthy flag"""
+    crop, separator, condition = name.partition('___')
+    if not separator:
+        crop, condition = '', name
+    # Lowercase words of the crop name, so "Corn_(maize)" matches "corn" and "maize"
+    keywords = tuple(re.findall(r'[a-z]+', crop.lower()))
+    return ClassInfo(index, name, crop, condition, condition.lower() == 'healthy', keywords)
+
+
+def load_localized_info(path='data/disease_info.json'):
+    """Translations stored next to the info file as disease_info.<locale>.json, keyed by locale"""
+    base, extension = os.path.splitext(path)
+    localized = {}
+    for locale_path in sorted(glob.glob(f"{base}.*{extension}")):
+        locale = locale_path[len(base) + 1:-len(extension)]
+        with open(locale_path, 'r', encoding='utf-8') as f:
+            localized[locale] = json.load(f)
+    return localized
+
+
+class ClassIndex:
+    """Per-class metadata and response fragments, built once per class list instead of per request"""
+
+    def __init__(self, class_names, disease_info, localized_info=None):
+        self.classes = [parse_class_name(i, name) for i, name in enumerate(class_names)]
+        self.by_name = {info.name: info for info in self.classes}
+        self.healthy = [info for info in self.classes if info.healthy]
+        self.diseased = [info for info in self.classes if not info.healthy]
+        self.crops = {}
+        for info in self.classes:
+            self.crops.setdefault(info.crop, []).append(info)
+
+        self.locales = sorted(localized_info or {})
+        self._responses = {None: self._build_responses(disease_info)}
+        for locale, translated in (localized_info or {}).items():
+            # Untranslated fields fall back to the default text
+            merged = {name: dict(disease_info.get(name, DEFAULT_INFO), **translated.get(name, {}))
+                      for name in class_names}
+            self._responses[locale] = self._build_responses(merged)
+
+    def _build_responses(self, disease_info):
+        """(response dict without confidence, serialized info fields) for every class"""
+        responses = []
+        for info in self.classes:
+            data = disease_info.get(info.name, DEFAULT_INFO)
+            response = {
+                "disease": info.name,
+                "description": data["description"],
+                "symptoms": data["symptoms"],
+                "remedies": data["remedies"]
+            }
+            fragment = json.dumps({key: response[key] for key in ('description', 'symptoms', 'remedies')})[1:-1]
+            responses.append((response, f'{{"disease":{json.dumps(info.name)},"confidence":', f',{fragment}'))
+        return responses
+
+    def __len__(self):
+        return len(self.classes)
+
+    def name(self, index):
+        """Class name for a model output index, or a placeholder when the model has more outputs"""
+        if index < len(self.classes):
+            return self.classes[index].name
+        return f"Unknown_Class_{index}"
+
+    def crop_for(self, text):
+        """First crop whose name appears in text (e.g. an upload filename), or None"""
+        text = text.lower()
+        for crop, members in self.crops.items():
+            if any(keyword in text for keyword in members[0].keywords):
+                return crop
+        return None
+
+    def matching(self, words):
+        """Classes whose condition mentions any of the given words"""
+        return [info for info in self.classes if any(word in info.condition.lower() for word in words)]
+
+    def response(self, index, confidence, locale=None):
+        """Prediction response dict; the info fields are shared, read-only objects"""
+        if index >= len(self.classes):
+            return dict(DEFAULT_INFO, disease=self.name(index), confidence=confidence)
+        response = self._responses.get(locale, self._responses[None])[index][0]
+        return {"disease": response["disease"], "confidence": confidence, **response}
+
+    def response_json(self, index, confidence, locale=None, **extra):
+        """The same response serialized to JSON bytes by joining pre-encoded pieces"""
+        if index >= len(self.classes):
+            return json.dumps(dict(self.response(index, confidence), **extra)).encode('utf-8')
+        _, head, tail = self._responses.get(locale, self._responses[None])[index]
+        extra_json = ''.join(f",{json.dumps(key)}:{json.dumps(value)}" for key, value in extra.items())
+        return f"{head}{json.dumps(float(confidence))}{tail}{extra_json}}}".encode('utf-8')
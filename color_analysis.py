@@ -0,0 +1,120 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# HSV bands (OpenCV ranges: H 0-179, S/V 0-255), inclusive like cv2.inRange
+BANDS = {
+    'green': ((40, 30, 30), (80, 255, 255)),    # healthy tissue
+    'brown': ((10, 50, 50), (30, 255, 255)),    # brown/yellow lesions
+    'yellow': ((20, 50, 50), (34, 255, 255)),   # chlorosis
+    'dark': ((0, 0, 0), (179, 255, 29)),        # necrotic / black rot, below the green V floor
+}
+
+FEATURE_NAMES = ['green_ratio', 'brown_ratio', 'yellow_ratio', 'dark_ratio',
+                 'leaf_ratio', 'lesion_area_ratio', 'lesion_count', 'mean_saturation', 'mean_value']
+
+# Every S and V threshold used by a band; pixels are binned between consecutive ones
+_THRESHOLDS = sorted({t for lower, upper in BANDS.values() for t in (lower[1], lower[2], upper[1] + 1, upper[2] + 1)
+                      if 0 < t <= 255})
+
+
+def _bin_lut():
+    lut = np.zeros(256, dtype=np.intp)
+    for t in _THRESHOLDS:
+        lut[t:] += 1
+    return lut
+
+
+_SV_LUT = _bin_lut()
+_NUM_BINS = len(_THRESHOLDS) + 1
+# uint8 LUTs so cv2.LUT yields s_bin * bins + v_bin without leaving OpenCV
+_S_CODE = (_SV_LUT * _NUM_BINS).astype(np.uint8)
+_V_CODE = _SV_LUT.astype(np.uint8)
+# Lowest S/V value that falls in each bin, to decide band membership per bin
+_BIN_LOW = np.array([0] + _THRESHOLDS)
+_BIN_HIGH = np.array(_THRESHOLDS + [256]) - 1
+
+
+def _band_masks():
+    """Boolean (180, bins, bins) tables: is (hue, s_bin, v_bin) inside each band"""
+    hue = np.arange(180)[:, None, None]
+    s_low, s_high = _BIN_LOW[None, :, None], _BIN_HIGH[None, :, None]
+    v_low, v_high = _BIN_LOW[None, None, :], _BIN_HIGH[None, None, :]
+    masks = {}
+    for name, (lower, upper) in BANDS.items():
+        masks[name] = ((hue >= lower[0]) & (hue <= upper[0])
+                       & (s_low >= lower[1]) & (s_high <= upper[1])
+                       & (v_low >= lower[2]) & (v_high <= upper[2]))
+    return masks
+
+
+_BAND_MASKS = _band_masks()
+
+
+def decode_for_analysis(source, max_side=256):
+    """Decode a path or encoded bytes to RGB, downscaled so the longer side is <= max_side.
+
+    JPEGs are reduced during decode (libjpeg DCT scaling), so a 12 MP photo never
+    materialises at full resolution. max_side=None keeps the original size.
+    """
+    img = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    if max_side:
+        if img.format == 'JPEG':
+            img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), Image.BILINEAR)
+    else:
+        img = img.convert('RGB')
+    return np.asarray(img)
+
+
+def color_features(rgb):
+    """Feature vector (see FEATURE_NAMES) from one HSV conversion and one histogram pass"""
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    h, s, v = cv2.split(hsv)
+    # One joint histogram over (hue, saturation bin, value bin); every band is a sum over it
+    index = h.astype(np.uint16) * (_NUM_BINS * _NUM_BINS) + cv2.add(cv2.LUT(s, _S_CODE), cv2.LUT(v, _V_CODE))
+    hist = np.bincount(index.ravel(), minlength=180 * _NUM_BINS * _NUM_BINS).reshape(180, _NUM_BINS, _NUM_BINS)
+    total = float(h.size)
+    ratios = {name: hist[mask].sum() / total for name, mask in _BAND_MASKS.items()}
+
+    lesion = ratios['brown'] + ratios['dark']
+    leaf = ratios['green'] + lesion
+    # Lesion count on the (already small) brown mask
+    brown_mask = cv2.inRange(hsv, BANDS['brown'][0], BANDS['brown'][1])
+    _, _, stats, _ = cv2.connectedComponentsWithStats(brown_mask, connectivity=8)
+    # Ignore specks smaller than 0.05% of the image
+    min_area = max(1, int(total * 0.0005))
+    lesion_count = int((stats[1:, cv2.CC_STAT_AREA] >= min_area).sum())
+
+    _, mean_s, mean_v, _ = cv2.mean(hsv)
+    return np.array([
+        ratios['green'], ratios['brown'], ratios['yellow'], ratios['dark'],
+        min(leaf, 1.0), lesion / leaf if leaf else 0.0, lesion_count,
+        mean_s / 255.0, mean_v / 255.0
+    ], dtype=np.float32)
+
+
+def analyze(source, max_side=256):
+    """Feature vector for one image path or encoded bytes"""
+    return color_features(decode_for_analysis(source, max_side))
+
+
+def analyze_batch(sources, max_side=256, workers=4):
+    """(N, len(FEATURE_NAMES)) features for many images; decode runs on a thread pool"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return np.stack(list(pool.map(lambda source: analyze(source, max_side), sources)))
+
+
+def reference_color_ratios(image_path):
+    """The original full-resolution app_demo analysis (two inRange passes), kept for benchmarking"""
+    img = cv2.imread(image_path)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
+    green_mask = cv2.inRange(hsv, np.array(BANDS['green'][0]), np.array(BANDS['green'][1]))
+    brown_mask = cv2.inRange(hsv, np.array(BANDS['brown'][0]), np.array(BANDS['brown'][1]))
+    pixels = img.shape[0] * img.shape[1]
+    return np.sum(green_mask > 0) / pixels, np.sum(brown_mask > 0) / pixels
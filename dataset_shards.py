@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+One-time conversion of data/PlantVillage/{train,test}/<class>/ image folders into
+memory-mapped uint8 .npy shards of 224x224 tensors plus labels, described by an
+index.json. Training reads the shards directly instead of re-decoding JPEGs.
+
+Usage:
+    python dataset_shards.py data/PlantVillage --output data/shards
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from score_images import find_images, iter_decoded_batches
+
+INDEX_FILE = 'index.json'
+
+
+def write_split(pool, items, class_index, output_dir, split, shard_size, image_size, batch_size, workers):
+    """Decode one split into shards; returns the index entries for its shards and the stored paths"""
+    shards = []
+    stored = []
+    paths = [path for path, _ in items]
+    labels = np.array([class_index[label] for _, label in items], dtype=np.int16)
+    skipped = 0
+    for shard_id, start in enumerate(range(0, len(items), shard_size)):
+        stop = min(start + shard_size, len(items))
+        name = f"{split}_{shard_id:04d}"
+        images = np.lib.format.open_memmap(os.path.join(output_dir, f"{name}_images.npy"), mode='w+',
+                                           dtype=np.uint8, shape=(stop - start, image_size[1], image_size[0], 3))
+        keep = np.ones(stop - start, dtype=bool)
+        offset = 0
+        for batch, failed in iter_decoded_batches(pool, paths[start:stop], batch_size, max_in_flight=2 * workers):
+            images[offset:offset + len(batch)] = batch
+            keep[[offset + i for i in failed]] = False
+            offset += len(batch)
+        images.flush()
+        count = int(keep.sum())
+        if count < len(keep):
+            # Compact away unreadable files so every stored row is a real image
+            skipped += len(keep) - count
+            compact = np.array(images[keep])
+            del images
+            np.save(os.path.join(output_dir, f"{name}_images.npy"), compact)
+        else:
+            del images
+        np.save(os.path.join(output_dir, f"{name}_labels.npy"), labels[start:stop][keep])
+        stored += [path for path, kept in zip(paths[start:stop], keep) if kept]
+        shards.append({'images': f"{name}_images.npy", 'labels': f"{name}_labels.npy", 'count': count})
+    if skipped:
+        print(f"Skipped {skipped} unreadable images in {split}")
+    return shards, stored
+
+
+def build_shards(dataset_path='data/PlantVillage', output_dir='data/shards', shard_size=2048,
+                 image_size=(224, 224), batch_size=64, workers=None):
+    """Convert every split under dataset_path into shards and write the index"""
+    splits = [split for split in ('train', 'test') if os.path.isdir(os.path.join(dataset_path, split))]
+    if not splits:
+        raise SystemExit(f"No train/ or test/ folders under {dataset_path}")
+    # Same class order as flow_from_directory / image_dataset_from_directory
+    classes = sorted(name for name in os.listdir(os.path.join(dataset_path, splits[0]))
+                     if os.path.isdir(os.path.join(dataset_path, splits[0], name)))
+    class_index = {name: i for i, name in enumerate(classes)}
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    index = {'classes': classes, 'image_size': list(image_size), 'source': os.path.abspath(dataset_path),
+             'created': time.time(), 'splits': {}}
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        for split in splits:
+            split_dir = os.path.join(dataset_path, split)
+            items = [(path, label) for path, label in find_images(split_dir) if label in class_index]
+            shards, stored = write_split(pool, items, class_index, output_dir, split, shard_size,
+                                         image_size, batch_size, workers)
+            # Row order of the shards, relative to the split folder
+            index['splits'][split] = {'count': sum(shard['count'] for shard in shards), 'shards': shards,
+                                      'images': [os.path.relpath(path, split_dir) for path in stored]}
+            print(f"{split}: {index['splits'][split]['count']} images in {len(shards)} shards")
+
+    # Written last, so a partial conversion is never picked up by training
+    with open(os.path.join(output_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def has_shards(shard_dir):
+    return os.path.exists(os.path.join(shard_dir, INDEX_FILE))
+
+
+def shard_image_paths(index, split='train'):
+    """Files stored in a shard split, relative to the split folder
+
+    Indexes written before the file list was recorded fall back to the files that
+    existed when the shards were created.
+    """
+    entry = index['splits'][split]
+    if 'images' in entry:
+        return entry['images']
+    split_dir = os.path.join(index['source'], split)
+    return [os.path.relpath(path, split_dir) for path, label in find_images(split_dir)
+            if label in index['classes'] and os.path.getmtime(path) <= index['created']]
+
+
+class ShardedSplit:
+    """Memory-mapped view of one split; rows are read on demand by global index"""
+
+    def __init__(self, shard_dir, split):
+        with open(os.path.join(shard_dir, INDEX_FILE), 'r') as f:
+            index = json.load(f)
+        self.classes = index['classes']
+        self.image_size = tuple(index['image_size'])
+        shards = index['splits'][split]['shards']
+        self.images = [np.load(os.path.join(shard_dir, shard['images']), mmap_mode='r') for shard in shards]
+        self.labels = np.concatenate([np.load(os.path.join(shard_dir, shard['labels'])) for shard in shards])
+        self.offsets = np.cumsum([0] + [shard['count'] for shard in shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def read(self, indices):
+        """Return (uint8 images, int labels) for sorted global row indices"""
+        indices = np.asarray(indices)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+        images = np.concatenate([self.images[s][indices[shard_ids == s] - self.offsets[s]]
+                                 for s in np.unique(shard_ids)])
+        return images, self.labels[indices]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a PlantVillage-style image tree into .npy shards")
+    parser.add_argument('dataset', nargs='?', default='data/PlantVillage', help="Folder with train/ and test/")
+    parser.add_argument('--output', default='data/shards')
+    parser.add_argument('--shard-size', type=int, default=2048, help="Images per shard")
+    parser.add_argument('--workers', type=int, default=None, help="Decode processes (default: CPU count)")
+    args = parser.parse_args()
+    build_shards(args.dataset, args.output, args.shard_size, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
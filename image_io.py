@@ -0,0 +1,91 @@
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# Background writer so persisting uploads stays off the request latency path
+_save_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='upload-writer')
+
+
+def decode_image(data, target_size=(224, 224)):
+    """Decode encoded image bytes in memory to an RGB uint8 array of target_size"""
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        # Let libjpeg downscale in the DCT domain (1/2, 1/4, 1/8) while staying >= target_size
+        img.draft('RGB', target_size)
+    # Phone photos are often stored sideways with an EXIF orientation tag
+    img = np.asarray(ImageOps.exif_transpose(img).convert('RGB'))
+    if img.shape[1::-1] != tuple(target_size):
+        img = cv2.resize(img, target_size)
+    return img
+
+
+# Flipped full image, centre crop and its flip, four corner crops and their flips
+MAX_AUGMENTED_VIEWS = 11
+
+
+def augmented_views(data, target_size=(224, 224), num_views=8, zoom=1.15):
+    """Flipped, cropped and rescaled target_size views of one image as a uint8 (N, h, w, 3) batch"""
+    width, height = target_size
+    # Decoded once slightly larger than the model input, so crops cover different regions
+    large = decode_image(data, (int(width * zoom), int(height * zoom)))
+    full = cv2.resize(large, target_size)
+    top = (large.shape[0] - height) // 2
+    left = (large.shape[1] - width) // 2
+    centre = large[top:top + height, left:left + width]
+    corners = [large[:height, :width], large[:height, -width:], large[-height:, :width], large[-height:, -width:]]
+    views = [full[:, ::-1], centre, centre[:, ::-1]] + corners + [crop[:, ::-1] for crop in corners]
+    return np.stack(views[:num_views])
+
+
+def make_thumbnail(data, max_side=320, image_format='WEBP', quality=80):
+    """Encode a small, upright preview of encoded image bytes"""
+    img = Image.open(io.BytesIO(data))
+    if img.format == 'JPEG':
+        img.draft('RGB', (max_side, max_side))
+    # Phone photos are often stored sideways with an EXIF rotation
+    img = ImageOps.exif_transpose(img).convert('RGB')
+    img.thumbnail((max_side, max_side))
+    out = io.BytesIO()
+    img.save(out, format=image_format, quality=quality)
+    return out.getvalue()
+
+
+def write_file(data, path):
+    # Unique temp file: concurrent uploads of the same photo write the same path
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # Atomic rename so a half-written upload is never served
+        os.replace(tmp_path, path)
+    except FileNotFoundError:
+        # Content-addressed, so another writer's identical file is as good as ours
+        if not os.path.exists(path):
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def save_upload_async(data, path):
+    """Persist upload bytes in the background and return the Future"""
+    return _save_executor.submit(write_file, data, path)
+
+
+def load_image_batch(paths, target_size=(224, 224)):
+    """Decode a list of image files into a uint8 batch; unreadable files are reported by index"""
+    images = []
+    failed = []
+    for i, path in enumerate(paths):
+        try:
+            with open(path, 'rb') as f:
+                images.append(decode_image(f.read(), target_size))
+        except Exception:
+            failed.append(i)
+            images.append(np.zeros((target_size[1], target_size[0], 3), dtype=np.uint8))
+    return np.stack(images), failed
@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from lazy_thread import LazyThread
+
+
+class InferenceBatcher:
+    """Group single-image prediction requests into batched model calls"""
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=10.0, max_queue_size=256):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._worker = LazyThread(self._run, 'inference-batcher')
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._images = 0
+        self._largest_batch = 0
+        self._batch_sizes = {}
+        self._queue_wait_total = 0.0
+        self._inference_total = 0.0
+        self._errors = 0
+
+    def submit(self, image):
+        """Queue one preprocessed image (H, W, C) and return a Future for its probabilities"""
+        self._worker.ensure_started()
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    def predict(self, image, timeout=None):
+        """Blocking helper around submit()"""
+        return self.submit(image).result(timeout=timeout)
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            images = np.stack([item[0] for item in batch])
+            try:
+                predictions = self.predict_fn(images)
+            except Exception as e:
+                with self._stats_lock:
+                    self._errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            for (_, future, _), probs in zip(batch, predictions):
+                future.set_result(probs)
+
+            with self._stats_lock:
+                size = len(batch)
+                self._batches += 1
+                self._images += size
+                self._largest_batch = max(self._largest_batch, size)
+                self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+                self._queue_wait_total += sum(started - item[2] for item in batch)
+                self._inference_total += finished - started
+
+    def stats(self):
+        """Return queue depth and batch-size statistics for tuning"""
+        with self._stats_lock:
+            batches = self._batches or 1
+            images = self._images or 1
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': self._batches,
+                'images': self._images,
+                'errors': self._errors,
+                'avg_batch_size': self._images / batches,
+                'largest_batch': self._largest_batch,
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'avg_queue_wait_ms': self._queue_wait_total / images * 1000.0,
+                'avg_inference_ms': self._inference_total / batches * 1000.0,
+            }
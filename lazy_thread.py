@@ -0,0 +1,23 @@
+import threading
+
+
+class LazyThread:
+    """A daemon thread running target, started by the first ensure_started() call
+
+    Background workers start lazily so the thread is created in the process that uses
+    it, after gunicorn forks. A thread that has died is started again.
+    """
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.target, name=self.name, daemon=True)
+                self._thread.start()
@@ -0,0 +1,200 @@
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from lazy_thread import LazyThread
+
+# Seconds; covers sub-millisecond cache hits up to slow CPU inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metrics:
+    """Prometheus-style counters, gauges and histograms, aggregated across worker processes.
+
+    Each process keeps its samples in memory (one lock, no I/O on the hot path) and a
+    background thread snapshots them to directory/metrics-<pid>.json. render() merges
+    every snapshot: counters and histograms are summed, gauges are reported per live pid.
+    With directory=None only the current process is reported.
+    """
+
+    def __init__(self, namespace='plantdoc', directory=None, flush_interval=5.0):
+        self.namespace = namespace
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._types = {}
+        self._help = {}
+        self._buckets = {}
+        self._samples = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._flusher = LazyThread(self._flush_loop, 'metrics-flush')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def declare(self, name, kind, help_text, buckets=DEFAULT_BUCKETS):
+        """Register a metric: kind is 'counter', 'gauge' or 'histogram'"""
+        name = f"{self.namespace}_{name}"
+        self._types[name] = kind
+        self._help[name] = help_text
+        if kind == 'histogram':
+            self._buckets[name] = tuple(buckets)
+
+    def add_collector(self, fn):
+        """fn() is called at scrape time and may set gauges (e.g. queue depth)"""
+        self._collectors.append(fn)
+
+    def _key(self, name, labels):
+        return f"{self.namespace}_{name}", tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1.0, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0.0) + value
+        self._ensure_flushing()
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._samples[key] = float(value)
+        self._ensure_flushing()
+
+    def replace(self, name, value, **labels):
+        """Set a gauge and drop its other label sets, e.g. an info metric's previous version"""
+        key = self._key(name, labels)
+        with self._lock:
+            for other in [other for other in self._samples if other[0] == key[0]]:
+                del self._samples[other]
+            self._samples[key] = float(value)
+        self._ensure_flushing()
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        buckets = self._buckets[key[0]]
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                # Per-bucket (non-cumulative) counts, then +Inf, then sum
+                sample = self._samples[key] = [0] * (len(buckets) + 1) + [0.0]
+            sample[index] += 1
+            sample[-1] += value
+        self._ensure_flushing()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the with-block in histogram name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _ensure_flushing(self):
+        if self.directory:
+            self._flusher.ensure_started()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error writing metrics snapshot: {e}")
+
+    def _snapshot(self):
+        with self._lock:
+            return [[name, list(labels), value if not isinstance(value, list) else list(value)]
+                    for (name, labels), value in self._samples.items()]
+
+    def flush(self):
+        """Write this process's samples for other workers' /metrics to read"""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+
+    def _load_all(self):
+        """(pid, samples) for this process and every snapshot on disk"""
+        own_pid = os.getpid()
+        yield own_pid, self._snapshot()
+        if not self.directory:
+            return
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            if pid == own_pid:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    yield pid, json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def render(self):
+        """Prometheus text exposition format for all workers"""
+        for collect in self._collectors:
+            collect()
+        merged = {}
+        for pid, samples in self._load_all():
+            alive = None
+            for name, labels, value in samples:
+                kind = self._types.get(name)
+                if kind is None:
+                    continue
+                labels = tuple(tuple(label) for label in labels)
+                if kind == 'gauge':
+                    # Gauges describe a live worker, so dead workers' values are dropped
+                    if alive is None:
+                        alive = pid == os.getpid() or _pid_alive(pid)
+                    if alive:
+                        merged[(name, labels + (('pid', str(pid)),))] = value
+                elif kind == 'counter':
+                    merged[(name, labels)] = merged.get((name, labels), 0.0) + value
+                else:
+                    total = merged.setdefault((name, labels), [0] * len(value))
+                    merged[(name, labels)] = [a + b for a, b in zip(total, value)]
+
+        lines = []
+        for name in sorted(self._types):
+            lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {self._types[name]}")
+            for (sample_name, labels), value in sorted(merged.items()):
+                if sample_name != name:
+                    continue
+                if self._types[name] != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self._buckets[name] + ('+Inf',), value[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
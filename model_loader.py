@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+
+
+class BackgroundModelLoader:
+    """Load the model on a background thread so a worker serves /model_status while it warms up
+
+    load(report) does the work and returns True on success; it calls report(state) to
+    move from 'loading' to 'warming'. The state is 'idle' until the loader is started,
+    then 'loading', 'warming' and finally 'ready' or 'failed'.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.state = 'idle'
+        self.error = None
+        self.ready_seconds = None
+        self._started = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # Once per process: a loader started before gunicorn forks has no thread in the worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.state = 'loading'
+            self._started = time.perf_counter()
+            threading.Thread(target=self._run, name='model-loader', daemon=True).start()
+
+    def _report(self, state):
+        self.state = state
+
+    def _run(self):
+        try:
+            ok = self.load(self._report)
+        except Exception as e:
+            self.error = str(e)
+            ok = False
+        self.ready_seconds = time.perf_counter() - self._started
+        self.state = 'ready' if ok else 'failed'
+
+    def status(self):
+        return {'state': self.state, 'error': self.error, 'ready_seconds': self.ready_seconds}
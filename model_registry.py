@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Versioned model registry under models/registry/.
+
+Each version is an immutable directory holding the serving artifacts, class_names.json
+and a manifest.json (version, class list, input size, per-file SHA-256). CURRENT names
+the newest published version; PINNED, when present, overrides it on every worker.
+
+Usage:
+    python model_registry.py list
+    python model_registry.py publish          # snapshot the artifacts in models/
+    python model_registry.py activate <version>
+    python model_registry.py pin <version> | unpin
+    python model_registry.py verify <version>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+
+from lazy_thread import LazyThread
+from model_runtime import RUNTIME_FILES
+
+REGISTRY_DIR = 'models/registry'
+MANIFEST_FILE = 'manifest.json'
+
+# Everything a request needs from one model version; replaced as a whole, never mutated.
+# version identifies the weights+runtime (cache keys); registry_version is None for unversioned models.
+ModelHandle = namedtuple('ModelHandle', ['model', 'class_names', 'version', 'runtime', 'input_size',
+                                         'registry_version'])
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, text):
+    with open(f"{path}.tmp", 'w') as f:
+        f.write(text)
+    os.replace(f"{path}.tmp", path)
+
+
+class ModelRegistry:
+    """Publish, list, activate, pin and verify model versions"""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    def version_dir(self, version):
+        return os.path.join(self.root, version)
+
+    def _read_pointer(self, name):
+        try:
+            with open(os.path.join(self.root, name), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_version(self):
+        return self._read_pointer('CURRENT')
+
+    def pinned_version(self):
+        return self._read_pointer('PINNED')
+
+    def active_version(self):
+        """The version workers should serve: the pin if set, else the newest activated"""
+        return os.environ.get('MODEL_VERSION') or self.pinned_version() or self.current_version()
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        # Dot-prefixed entries are publish() staging directories, complete or not
+        return sorted(name for name in os.listdir(self.root)
+                      if not name.startswith('.') and os.path.exists(os.path.join(self.root, name, MANIFEST_FILE)))
+
+    def manifest(self, version):
+        with open(os.path.join(self.version_dir(version), MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+
+    def publish(self, model_dir='models', input_size=(224, 224), activate=True, metrics=None):
+        """Copy the artifacts in model_dir into a new version directory and return its name"""
+        files = [name for name in RUNTIME_FILES.values() if os.path.exists(os.path.join(model_dir, name))]
+        if RUNTIME_FILES['keras'] not in files:
+            raise FileNotFoundError(os.path.join(model_dir, RUNTIME_FILES['keras']))
+        with open(os.path.join(model_dir, 'class_names.json'), 'r') as f:
+            class_names = json.load(f)
+
+        checksums = {name: file_sha256(os.path.join(model_dir, name)) for name in files}
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{checksums[RUNTIME_FILES['keras']][:8]}"
+        # Build in a staging directory and rename, so a version is never seen half-copied
+        staging = os.path.join(self.root, f".{version}.tmp")
+        os.makedirs(staging, exist_ok=True)
+        for name in files + ['class_names.json']:
+            shutil.copy2(os.path.join(model_dir, name), os.path.join(staging, name))
+        manifest = {
+            'version': version,
+            'created': time.time(),
+            'class_names': class_names,
+            'num_classes': len(class_names),
+            'input_size': list(input_size),
+            'files': checksums,
+            'metrics': metrics or {}
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(staging, self.version_dir(version))
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        """Make version the newest (also used to roll back to an older one)"""
+        self._require(version)
+        _write_atomic(os.path.join(self.root, 'CURRENT'), version)
+
+    def pin(self, version):
+        self._require(version)
+        _write_atomic(os.path.join(self.root, 'PINNED'), version)
+
+    def unpin(self):
+        try:
+            os.remove(os.path.join(self.root, 'PINNED'))
+        except FileNotFoundError:
+            pass
+
+    def verify(self, version):
+        """Raise ValueError if any artifact no longer matches its manifest checksum"""
+        manifest = self.manifest(version)
+        for name, expected in manifest['files'].items():
+            if file_sha256(os.path.join(self.version_dir(version), name)) != expected:
+                raise ValueError(f"Checksum mismatch for {name} in model version {version}")
+        return manifest
+
+    def _require(self, version):
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version '{version}'")
+
+
+class RegistryWatcher:
+    """Poll the registry's active version and call reload(version) when it changes"""
+
+    def __init__(self, registry, reload, interval=10.0):
+        self.registry = registry
+        self.reload = reload
+        self.interval = interval
+        self.loaded_version = None
+        self._watcher = LazyThread(self._run, 'model-registry-watcher')
+
+    def ensure_started(self):
+        self._watcher.ensure_started()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                version = self.registry.active_version()
+                if version and version != self.loaded_version:
+                    self.reload(version)
+            except Exception as e:
+                print(f"Model registry check failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage versioned plant disease models")
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="List versions, marking the current and pinned ones")
+    publish = sub.add_parser('publish', help="Snapshot the artifacts in a model folder as a new version")
+    publish.add_argument('--model-dir', default='models')
+    publish.add_argument('--no-activate', action='store_true')
+    for name, help_text in [('activate', "Serve this version (roll back by activating an older one)"),
+                            ('pin', "Serve this version even when newer ones are published"),
+                            ('verify', "Check a version's files against its manifest checksums")]:
+        sub.add_parser(name, help=help_text).add_argument('version')
+    sub.add_parser('unpin', help="Go back to serving the newest activated version")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    if args.command == 'list':
+        current, pinned = registry.current_version(), registry.pinned_version()
+        for version in registry.versions():
+            manifest = registry.manifest(version)
+            flags = ' '.join(flag for flag, on in [('current', version == current), ('pinned', version == pinned)] if on)
+            metrics = manifest.get('metrics', {})
+            summary = '  '.join(f"{key}={metrics[key]}" for key in ('architecture', 'test_accuracy', 'cpu_latency_ms')
+                                if key in metrics)
+            print(f"{version}  {manifest['num_classes']:3d} classes  {', '.join(manifest['files'])}"
+                  + (f"  {summary}" if summary else '') + (f"  [{flags}]" if flags else ''))
+    elif args.command == 'publish':
+        print(registry.publish(args.model_dir, activate=not args.no_activate))
+    elif args.command == 'activate':
+        registry.activate(args.version)
+    elif args.command == 'pin':
+        registry.pin(args.version)
+    elif args.command == 'unpin':
+        registry.unpin()
+    elif args.command == 'verify':
+        registry.verify(args.version)
+        print(f"{args.version}: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import threading
+
+import numpy as np
+
+# Every runtime's predict() takes uint8 (N, H, W, 3) pixel batches. Models trained with the
+# resize/rescale layers in the graph get them as is; older models that expect float32 pixels
+# in [0, 1] are rescaled here.
+
+# Serving artifacts written by train_model.export_serving_models, per runtime
+RUNTIME_FILES = {
+    'keras': 'plant_disease_model.h5',
+    'tflite_fp16': 'plant_disease_model_fp16.tflite',
+    'tflite_int8': 'plant_disease_model_int8.tflite',
+    'onnx': 'plant_disease_model.onnx',
+}
+
+
+class KerasRuntime:
+    """Full TensorFlow/Keras float32 inference"""
+
+    def __init__(self, path):
+        from tensorflow.keras.models import load_model
+        self.path = path
+        self.model = load_model(path)
+        self.raw_input = self.model.inputs[0].dtype == 'uint8'
+
+    def predict(self, images):
+        if not self.raw_input:
+            images = images.astype(np.float32) / 255.0
+        return self.model.predict(images, verbose=0)
+
+
+class TFLiteRuntime:
+    """TFLite interpreter (float16 or int8 quantized) for CPU-only nodes"""
+
+    def __init__(self, path, num_threads=None):
+        try:
+            # The standalone interpreter avoids importing all of TensorFlow
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.path = path
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads or os.cpu_count())
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        # int8 and float exports of older models take pixels in [0, 1]
+        self.raw_input = self.input['dtype'] == np.uint8
+        self._shape = None
+        # A TFLite interpreter must not be invoked from two threads at once
+        self._lock = threading.Lock()
+
+    def predict(self, images):
+        with self._lock:
+            if images.shape != self._shape:
+                self.interpreter.resize_tensor_input(self.input['index'], list(images.shape))
+                self.interpreter.allocate_tensors()
+                self._shape = images.shape
+            self.interpreter.set_tensor(self.input['index'], self._quantize(images))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self.output['index']))
+
+    def _quantize(self, images):
+        dtype = self.input['dtype']
+        scale, zero_point = self.input['quantization']
+        if self.raw_input and (scale, zero_point) in ((0.0, 0), (1.0, 0)):
+            return images.astype(np.uint8, copy=False)
+        pixels = images if self.raw_input else images.astype(np.float32) / 255.0
+        if dtype == np.float32:
+            return pixels.astype(np.float32, copy=False)
+        info = np.iinfo(dtype)
+        return np.clip(np.round(pixels / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, outputs):
+        if self.output['dtype'] == np.float32:
+            return outputs
+        scale, zero_point = self.output['quantization']
+        return (outputs.astype(np.float32) - zero_point) * scale
+
+
+class OnnxRuntime:
+    """ONNX Runtime CPU inference"""
+
+    def __init__(self, path):
+        import onnxruntime
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.raw_input = self.session.get_inputs()[0].type == 'tensor(uint8)'
+
+    def predict(self, images):
+        if self.raw_input:
+            return self.session.run(None, {self.input_name: images.astype(np.uint8, copy=False)})[0]
+        return self.session.run(None, {self.input_name: images.astype(np.float32) / 255.0})[0]
+
+
+def runtime_path(kind, model_dir='models'):
+    """Path of the serving artifact for a runtime"""
+    if kind not in RUNTIME_FILES:
+        raise ValueError(f"Unknown model runtime '{kind}'. Choose from: {', '.join(RUNTIME_FILES)}")
+    return os.path.join(model_dir, RUNTIME_FILES[kind])
+
+
+def runtime_version(kind, model_dir='models'):
+    """Identify the serving artifact's weights, so cached predictions can be invalidated"""
+    stat = os.stat(runtime_path(kind, model_dir))
+    return f"{kind}-{int(stat.st_mtime)}-{stat.st_size}"
+
+
+def load_runtime(kind='keras', model_dir='models'):
+    """Load the serving artifact for the requested runtime"""
+    path = runtime_path(kind, model_dir)
+    if kind == 'keras':
+        return KerasRuntime(path)
+    if kind.startswith('tflite'):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return TFLiteRuntime(path)
+    return OnnxRuntime(path)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Shared inference process: loads the model once and serves predictions to every
+gunicorn worker over a local Unix socket, so workers no longer each hold a
+private copy of the weights and the TensorFlow runtime. It follows the model
+registry's active version like the workers do.
+
+Usage:
+    export MODEL_SERVER_AUTHKEY=$(python -c 'import secrets; print(secrets.token_hex(16))')
+    python model_server.py --runtime keras --socket /tmp/plantdoc-model.sock
+    MODEL_SERVER=/tmp/plantdoc-model.sock gunicorn -w 8 -b 0.0.0.0:5000 app:app
+"""
+
+import argparse
+import json
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from inference_batcher import InferenceBatcher
+from model_registry import ModelHandle, ModelRegistry, RegistryWatcher
+from model_runtime import load_runtime, runtime_version
+
+DEFAULT_SOCKET = '/tmp/plantdoc-model.sock'
+
+
+def authkey():
+    """MODEL_SERVER_AUTHKEY: only processes that know it (this app's workers) may connect
+
+    Connections exchange pickles, so there is no default key.
+    """
+    key = os.environ.get('MODEL_SERVER_AUTHKEY')
+    if not key:
+        raise RuntimeError("Set MODEL_SERVER_AUTHKEY (the same secret for model_server.py and the app workers)")
+    return key.encode()
+
+
+class RemoteRuntime:
+    """Runtime stand-in that forwards batches to a model_server process"""
+
+    def __init__(self, address=DEFAULT_SOCKET, timeout=30):
+        self.address = address
+        self.timeout = timeout
+        # One connection per thread: a Connection must not be shared mid-request
+        self._local = threading.local()
+        # The server first picks up the registry's active version, so this worker never serves an older one
+        info = self._call('reload')
+        self.version = info['version']
+        self.class_names = info['class_names']
+        self.input_size = tuple(info['input_size'])
+        self.registry_version = info['registry_version']
+        # Don't hand this connection down to forked gunicorn workers
+        self.close()
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = Client(self.address, family='AF_UNIX', authkey=authkey())
+            self._local.conn = conn
+        return conn
+
+    def _call(self, *message):
+        conn = self._connection()
+        try:
+            conn.send(message)
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Model server did not answer within {self.timeout}s")
+            status, payload = conn.recv()
+        except Exception:
+            # Drop the connection so the next call reconnects (e.g. after a server restart)
+            conn.close()
+            raise
+        if status != 'ok':
+            raise RuntimeError(f"Model server error: {payload}")
+        return payload
+
+    def predict(self, images):
+        # The server refuses the batch if it has switched versions, so old labels are never paired with new weights
+        return self._call('predict', np.ascontiguousarray(images), self.version)
+
+
+class ModelServer:
+    """Accept worker connections and run their tensors through one shared model"""
+
+    def __init__(self, runtime='keras', address=DEFAULT_SOCKET, model_dir='models',
+                 max_batch_size=32, max_wait_ms=5, watch_interval=10.0):
+        self.address = address
+        self.runtime = runtime
+        self.model_dir = model_dir
+        self.registry = ModelRegistry(os.path.join(model_dir, 'registry'))
+        self.model_handle = self._load(self.registry.active_version())
+        self._reload_lock = threading.Lock()
+        # Images from all workers are batched together before reaching the model
+        self.batcher = InferenceBatcher(self._predict, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        self.watcher = RegistryWatcher(self.registry, self._reload_watched, interval=watch_interval)
+        self.watcher.loaded_version = self.model_handle.registry_version
+
+    def _load(self, version):
+        if version:
+            manifest = self.registry.verify(version)
+            return ModelHandle(load_runtime(self.runtime, self.registry.version_dir(version)),
+                               manifest['class_names'], f"{version}/{self.runtime}", self.runtime,
+                               tuple(manifest['input_size']), version)
+        with open(os.path.join(self.model_dir, 'class_names.json'), 'r') as f:
+            class_names = json.load(f)
+        return ModelHandle(load_runtime(self.runtime, self.model_dir), class_names,
+                           runtime_version(self.runtime, self.model_dir), self.runtime, (224, 224), None)
+
+    def _predict(self, images):
+        return self.model_handle.model.predict(images)
+
+    def reload(self):
+        """Swap in the registry's active version if it isn't the one loaded; a failed load keeps the old one"""
+        with self._reload_lock:
+            version = self.registry.active_version()
+            if version and version != self.model_handle.registry_version:
+                print(f"Model registry switched to {version}, reloading...")
+                try:
+                    self.model_handle = self._load(version)
+                    print(f"Model server now serves {self.model_handle.version}")
+                except Exception as e:
+                    print(f"Could not load {version}: {e}")
+        return self.info()
+
+    def _reload_watched(self, version):
+        self.reload()
+        # Don't retry a broken version on every poll
+        self.watcher.loaded_version = version
+
+    def info(self):
+        handle = self.model_handle
+        return {'version': handle.version, 'class_names': handle.class_names, 'input_size': handle.input_size,
+                'registry_version': handle.registry_version}
+
+    def _check_version(self, expected):
+        if expected and expected != self.model_handle.version:
+            raise RuntimeError(f"Model server switched to {self.model_handle.version}; the worker will reload")
+
+    def handle(self, message):
+        command = message[0]
+        if command == 'predict':
+            expected = message[2] if len(message) > 2 else None
+            self._check_version(expected)
+            futures = [self.batcher.submit(image) for image in message[1]]
+            predictions = np.stack([future.result() for future in futures])
+            # Checked again: the batch may have run on a version swapped in meanwhile
+            self._check_version(expected)
+            return predictions
+        if command == 'info':
+            return self.info()
+        if command == 'reload':
+            return self.reload()
+        if command == 'stats':
+            return self.batcher.stats()
+        raise ValueError(f"Unknown command '{command}'")
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ('ok', self.handle(message))
+                except Exception as e:
+                    reply = ('error', str(e))
+                conn.send(reply)
+
+    def serve_forever(self):
+        key = authkey()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # Owner-only socket: created under a restrictive umask so there is no window before the chmod
+        previous_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family='AF_UNIX', authkey=key)
+        finally:
+            os.umask(previous_umask)
+        os.chmod(self.address, 0o600)
+        self.watcher.ensure_started()
+        with listener:
+            print(f"Model server ({self.model_handle.version}) listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the plant disease model to local app workers")
+    parser.add_argument('--runtime', default=os.environ.get('MODEL_RUNTIME', 'keras'),
+                        help="keras, tflite_fp16, tflite_int8 or onnx (default: $MODEL_RUNTIME or keras)")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument('--model-dir', default='models')
+    parser.add_argument('--batch-size', type=int, default=32, help="Largest cross-worker batch")
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--watch-interval', type=float, default=float(os.environ.get('MODEL_WATCH_INTERVAL', 10)),
+                        help="Seconds between registry checks (default: $MODEL_WATCH_INTERVAL or 10)")
+    args = parser.parse_args()
+
+    # Fail before loading the model rather than after
+    try:
+        authkey()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    ModelServer(args.runtime, args.socket, args.model_dir, args.batch_size, args.max_wait_ms,
+                args.watch_interval).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Draws the accuracy and loss curves of a training run from the history JSON that
+train_model.py writes next to the model. Training starts this script as its own
+process, so matplotlib never loads in the training or serving processes.
+
+Usage:
+    python plot_history.py models/training_history.json static/images/training_history.png
+"""
+
+import argparse
+import json
+import os
+
+
+def plot_history(history, output):
+    """Save side-by-side accuracy and loss curves for a Keras history dict"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 4))
+
+    plt.subplot(1, 2, 1)
+    plt.plot(history['accuracy'], label='Training Accuracy')
+    plt.plot(history['val_accuracy'], label='Validation Accuracy')
+    plt.title('Model Accuracy')
+    plt.xlabel('Epoch')
+    plt.ylabel('Accuracy')
+    plt.legend()
+
+    plt.subplot(1, 2, 2)
+    plt.plot(history['loss'], label='Training Loss')
+    plt.plot(history['val_loss'], label='Validation Loss')
+    plt.title('Model Loss')
+    plt.xlabel('Epoch')
+    plt.ylabel('Loss')
+    plt.legend()
+
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    plt.savefig(output)
+    plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot training curves from a history JSON file")
+    parser.add_argument('history', nargs='?', default='models/training_history.json')
+    parser.add_argument('output', nargs='?', default='static/images/training_history.png')
+    args = parser.parse_args()
+
+    with open(args.history, 'r') as f:
+        plot_history(json.load(f), args.output)
+    print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
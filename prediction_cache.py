@@ -0,0 +1,156 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from sqlite_local import ThreadLocalSQLite
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with TTL expiry"""
+
+    def __init__(self, max_entries=4096, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if self.ttl and time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """LRU/TTL cache in a local SQLite file shared by every gunicorn worker on the box"""
+
+    def __init__(self, path, max_entries=4096, ttl=86400, evict_every=64):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._db = ThreadLocalSQLite(path)
+        self._writes = 0
+        with self._db.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS prediction_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS prediction_cache_accessed ON prediction_cache (accessed)')
+
+    def get(self, key):
+        conn = self._db.connection()
+        now = time.time()
+        row = conn.execute('SELECT value, created FROM prediction_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        with conn:
+            if self.ttl and now - created > self.ttl:
+                conn.execute('DELETE FROM prediction_cache WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE prediction_cache SET accessed = ? WHERE key = ?', (now, key))
+        return value
+
+    def set(self, key, value):
+        conn = self._db.connection()
+        now = time.time()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO prediction_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, value, now, now)
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        if self.ttl:
+            conn.execute('DELETE FROM prediction_cache WHERE created < ?', (now - self.ttl,))
+        conn.execute(
+            'DELETE FROM prediction_cache WHERE key IN ('
+            'SELECT key FROM prediction_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def __len__(self):
+        return self._db.connection().execute('SELECT COUNT(*) FROM prediction_cache').fetchone()[0]
+
+
+class PredictionCache:
+    """Prediction results keyed by image content hash (and optionally a perceptual hash)"""
+
+    def __init__(self, backend, perceptual=False):
+        self.backend = backend
+        self.perceptual = perceptual
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_key(data):
+        """SHA-256 of the encoded upload bytes"""
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def perceptual_key(image):
+        """64-bit difference hash of a preprocessed (224, 224, 3) image"""
+        img = np.asarray(image)
+        if img.dtype != np.uint8:
+            img = np.clip(img * 255.0, 0, 255).astype(np.uint8)
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return 'p' + format(int(np.packbits(bits).view('>u8')[0]), '016x')
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, result):
+        self.backend.set(key, json.dumps(result))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_prediction_cache(kind, path=None, max_entries=4096, ttl=86400, perceptual=False):
+    """Build a PredictionCache for the configured backend ('memory', 'sqlite' or 'off')"""
+    if kind == 'off':
+        return None
+    if kind == 'sqlite':
+        backend = SQLiteCacheBackend(path or 'cache/prediction_cache.sqlite3', max_entries, ttl)
+    else:
+        backend = MemoryCacheBackend(max_entries, ttl)
+    return PredictionCache(backend, perceptual=perceptual)
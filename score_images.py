@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Offline bulk scorer: runs the trained CNN over a directory of class folders
+(laid out like data/PlantVillage/test) and writes per-image results plus
+per-class confusion statistics.
+
+Usage:
+    python score_images.py data/PlantVillage/test --output results/test_scores.csv
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from image_io import load_image_batch
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+def find_images(root):
+    """Return sorted (path, label) pairs where label is the class folder name"""
+    items = []
+    for label in sorted(os.listdir(root)):
+        class_dir = os.path.join(root, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for dirpath, _, filenames in os.walk(class_dir):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    items.append((os.path.join(dirpath, filename), label))
+    return items
+
+
+def iter_decoded_batches(pool, paths, batch_size, max_in_flight):
+    """Decode path batches in worker processes, keeping at most max_in_flight batches queued"""
+    chunks = deque(paths[i:i + batch_size] for i in range(0, len(paths), batch_size))
+    pending = deque()
+    while chunks or pending:
+        while chunks and len(pending) < max_in_flight:
+            pending.append(pool.apply_async(load_image_batch, (chunks.popleft(),)))
+        yield pending.popleft().get()
+
+
+def class_statistics(confusion, class_names):
+    """Per-class support, precision, recall and F1 from a confusion matrix (rows = true)"""
+    stats = []
+    for i, name in enumerate(class_names):
+        tp = int(confusion[i, i])
+        support = int(confusion[i].sum())
+        predicted = int(confusion[:, i].sum())
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        stats.append({
+            'class': name,
+            'support': support,
+            'predicted': predicted,
+            'true_positives': tp,
+            'precision': precision,
+            'recall': recall,
+            'f1': f1
+        })
+    return stats
+
+
+def write_rows(rows, path, fmt):
+    """Write a list of dicts as CSV or Parquet"""
+    if fmt == 'parquet':
+        try:
+            import pandas as pd
+        except ImportError:
+            raise SystemExit("Parquet output needs pandas and pyarrow: pip install pandas pyarrow")
+        pd.DataFrame(rows).to_parquet(path, index=False)
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def score_directory(root, output, fmt='csv', batch_size=64, workers=None):
+    """Score every image under root and write results next to output"""
+    items = find_images(root)
+    if not items:
+        raise SystemExit(f"No images found under {root}")
+    paths = [path for path, _ in items]
+    workers = workers or os.cpu_count() or 1
+
+    # Start decode workers before TensorFlow is imported so they stay small
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(workers) as pool:
+        import app
+        app.load_ml_model()
+        handle = app.model_handle
+        if handle is None:
+            raise SystemExit("No trained model found. Run train_model.py first.")
+        class_names = handle.class_names
+        class_index = {name: i for i, name in enumerate(class_names)}
+        num_classes = len(class_names)
+
+        rows = []
+        confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        start = time.perf_counter()
+        inference_time = 0.0
+        offset = 0
+        for images, failed in iter_decoded_batches(pool, paths, batch_size, max_in_flight=2 * workers):
+            # uint8 pixels, as from app.preprocess_image; the model rescales them
+            t0 = time.perf_counter()
+            predictions = handle.model.predict(images)
+            inference_time += time.perf_counter() - t0
+
+            failed = set(failed)
+            for j, probabilities in enumerate(predictions):
+                path, label = items[offset + j]
+                if j in failed:
+                    rows.append({'path': path, 'label': label, 'predicted': '', 'confidence': 0.0,
+                                 'correct': False, 'error': 'unreadable image'})
+                    continue
+                predicted_idx = int(np.argmax(probabilities))
+                predicted = class_names[predicted_idx] if predicted_idx < num_classes else f"Unknown_Class_{predicted_idx}"
+                true_idx = class_index.get(label)
+                if true_idx is not None and predicted_idx < num_classes:
+                    confusion[true_idx, predicted_idx] += 1
+                rows.append({'path': path, 'label': label, 'predicted': predicted,
+                             'confidence': float(probabilities[predicted_idx]),
+                             'correct': predicted == label, 'error': ''})
+            offset += len(images)
+        elapsed = time.perf_counter() - start
+
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(output)[0]
+    write_rows(rows, output, fmt)
+    stats = class_statistics(confusion, class_names)
+    write_rows(stats, f"{stem}_class_stats.{fmt}", fmt)
+    with open(f"{stem}_confusion.csv", 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['true \\ predicted'] + class_names)
+        for name, row in zip(class_names, confusion):
+            writer.writerow([name] + row.tolist())
+
+    scored = int(confusion.sum())
+    summary = {
+        'images': len(rows),
+        'labelled_images': scored,
+        'accuracy': float(np.trace(confusion) / scored) if scored else None,
+        'workers': workers,
+        'batch_size': batch_size,
+        'elapsed_seconds': elapsed,
+        'inference_seconds': inference_time,
+        'images_per_second': len(rows) / elapsed if elapsed else None
+    }
+    with open(f"{stem}_summary.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a directory of plant images with the trained CNN")
+    parser.add_argument('directory', help="Directory with one sub-folder per class, e.g. data/PlantVillage/test")
+    parser.add_argument('--output', default='results/scores.csv', help="Per-image results file")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None, help="Decode processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.format == 'parquet' and args.output.endswith('.csv'):
+        args.output = args.output[:-4] + '.parquet'
+    summary = score_directory(args.directory, args.output, args.format, args.batch_size, args.workers)
+    print(f"Scored {summary['images']} images in {summary['elapsed_seconds']:.1f}s "
+          f"({summary['images_per_second']:.1f} images/s)")
+    if summary['accuracy'] is not None:
+        print(f"Accuracy: {summary['accuracy']:.4f}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalSQLite:
+    """A WAL-mode SQLite file shared by every worker, with one connection per thread
+
+    sqlite3 connections cannot be shared across threads, and one inherited through
+    a fork is not reused: the child opens its own.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -1,5 +1,6 @@
 // Global variables
 let currentResult = null;
+let currentPreviewUrl = null;
 
 // DOM elements
 const uploadArea = document.getElementById('upload-area');
@@ -112,6 +113,12 @@ function handleFile(file) {
         return;
     }
     
+    // Keep a local preview in case the server does not store the upload
+    if (currentPreviewUrl) {
+        URL.revokeObjectURL(currentPreviewUrl);
+    }
+    currentPreviewUrl = URL.createObjectURL(file);
+    
     // Show loading state
     showLoading();
     
@@ -158,7 +165,12 @@ function showResults(data) {
     loading.classList.add('hidden');
     
     // Update result content
-    document.getElementById('uploaded-image').src = data.image_path;
+    const uploadedImage = document.getElementById('uploaded-image');
+    uploadedImage.onerror = () => {
+        uploadedImage.onerror = null;
+        uploadedImage.src = currentPreviewUrl;
+    };
+    uploadedImage.src = data.image_path || currentPreviewUrl;
     document.getElementById('disease-name').textContent = formatDiseaseName(data.disease);
     document.getElementById('disease-description').textContent = data.description;
     document.getElementById('disease-symptoms').textContent = data.symptoms;
@@ -167,6 +179,10 @@ function showResults(data) {
     const confidenceBadge = document.getElementById('confidence-badge');
     const confidence = Math.round(data.confidence * 100);
     confidenceBadge.textContent = `${confidence}% Confidence`;
+    // Runner-up classes on hover, when the server sends them
+    confidenceBadge.title = (data.top_k || [])
+        .map(item => `${formatDiseaseName(item.disease)}: ${Math.round(item.probability * 100)}%`)
+        .join('\n');
     
     // Set confidence level class
     confidenceBadge.className = 'confidence-badge';
@@ -294,10 +310,20 @@ async function trainModel() {
     btn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Training...';
     btn.disabled = true;
     
+    const restoreButton = () => {
+        btn.innerHTML = originalText;
+        btn.disabled = false;
+    };
+    
     try {
         const response = await fetch('/train_model');
         const data = await response.json();
         
+        if (data.status_url) {
+            // Training runs in the background; follow its progress
+            followTrainingJob(data.status_url, btn, restoreButton);
+            return;
+        }
         if (data.success) {
             showSuccess('Model trained successfully!');
             checkModelStatus(); // Refresh model status
@@ -307,11 +333,68 @@ async function trainModel() {
     } catch (error) {
         console.error('Training error:', error);
         showError('Error starting model training');
-    } finally {
-        // Restore button
-        btn.innerHTML = originalText;
-        btn.disabled = false;
     }
+    restoreButton();
+}
+
+// Poll the job's status and show its progress on the button until it finishes
+// (polling rather than the /train_stream SSE, which would hold a sync worker for the whole run)
+function followTrainingJob(statusUrl, btn, done) {
+    const setLabel = text => {
+        btn.innerHTML = `<i class="fas fa-spinner fa-spin"></i> ${text}`;
+    };
+    let failures = 0;
+    
+    const poll = async () => {
+        let job;
+        try {
+            const response = await fetch(statusUrl);
+            job = await response.json();
+            if (!response.ok) {
+                showError(job.error || 'Training job not found');
+                done();
+                return;
+            }
+        } catch (error) {
+            console.error('Training status error:', error);
+            if (++failures >= 3) {
+                showError('Lost track of the training job');
+                done();
+                return;
+            }
+            setTimeout(poll, 2000);
+            return;
+        }
+        failures = 0;
+        
+        const p = job.progress || {};
+        if (job.status === 'completed') {
+            showSuccess('Model trained successfully!');
+            checkModelStatus();
+            done();
+            return;
+        }
+        if (job.status === 'unchanged') {
+            showSuccess('No new images since the last training; the model is unchanged');
+            done();
+            return;
+        }
+        if (job.status === 'failed') {
+            showError(`Training failed: ${job.error}`);
+            done();
+            return;
+        }
+        if (p.epoch) {
+            const batch = p.batch ? ` - batch ${p.batch}${p.batches ? '/' + p.batches : ''}` : '';
+            const accuracy = p.logs && p.logs.val_accuracy !== undefined
+                ? ` (val acc ${(p.logs.val_accuracy * 100).toFixed(1)}%)` : '';
+            setLabel(`Epoch ${p.epoch}/${p.epochs}${batch}${accuracy}`);
+        } else if (p.stage) {
+            setLabel(`Training: ${p.stage}...`);
+        }
+        setTimeout(poll, 2000);
+    };
+    poll();
 }
 
 // Show success message
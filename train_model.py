@@ -1,14 +1,14 @@
 import os
 import json
+import time
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
+from tensorflow.keras.layers import (Input, Resizing, Rescaling, Conv2D, SeparableConv2D, MaxPooling2D, Flatten,
+                                     GlobalAveragePooling2D, Dense, Dropout, BatchNormalization)
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping, ReduceLROnPlateau
-import matplotlib.pyplot as plt
-from sklearn.metrics import classification_report, confusion_matrix
+from tensorflow.keras.callbacks import Callback, ModelCheckpoint, EarlyStopping, ReduceLROnPlateau, BackupAndRestore
 import requests
 import zipfile
 import shutil
@@ -91,68 +91,301 @@ def download_real_plantvillage_dataset():
         print("Using sample data instead...")
         return download_sample_data()
 
-def create_cnn_model(num_classes, input_shape=(224, 224, 3)):
-    """Create a CNN model for plant disease classification"""
+def preprocessing_layers(image_size=(224, 224)):
+    """Resize and rescale as graph layers: the one preprocessing definition for training and serving"""
+    return [
+        Resizing(image_size[1], image_size[0], name='resize'),
+        Rescaling(1. / 255, name='rescale')
+    ]
+
+def takes_raw_pixels(model):
+    """True for models with the preprocessing layers in the graph; models from before they
+    were added take [0, 1] floats instead of uint8 pixels"""
+    return model.inputs[0].dtype == tf.uint8
+
+def _model_input(model, images):
+    """A batch of uint8 pixels in the form model takes"""
+    return images if takes_raw_pixels(model) else tf.cast(images, tf.float32) / 255.0
+
+# Architecture presets for create_cnn_model:
+# baseline  - five conv blocks, Flatten into Dense(1024)/Dense(512) (the 5x5x512 Flatten alone feeds 13M weights)
+# gap       - the same conv blocks with a global-average-pooling head
+# separable - depthwise-separable conv blocks with a global-average-pooling head
+# mobilenet - MobileNetV2 backbone; ImageNet weights when a local copy exists, otherwise from scratch
+ARCHITECTURES = ('baseline', 'gap', 'separable', 'mobilenet')
+
+def conv_blocks(separable=False, filters=(32, 64, 128, 256, 512)):
+    """Conv + batch norm + max-pool blocks; separable=True uses depthwise-separable convolutions"""
+    layer = SeparableConv2D if separable else Conv2D
+    blocks = []
+    for width in filters:
+        blocks += [layer(width, (3, 3), activation='relu'), BatchNormalization(), MaxPooling2D(2, 2)]
+    return blocks
+
+def mobilenet_weights_path(alpha=1.0, image_size=224):
+    """Locally available MobileNetV2 ImageNet weights (MOBILENET_WEIGHTS or the Keras cache), or None"""
+    path = os.environ.get('MOBILENET_WEIGHTS') or os.path.expanduser(
+        f'~/.keras/models/mobilenet_v2_weights_tf_dim_ordering_tf_kernels_{alpha}_{image_size}_no_top.h5')
+    return path if os.path.exists(path) else None
+
+def create_cnn_model(num_classes, input_shape=(224, 224, 3), architecture='baseline'):
+    """Create a CNN model for plant disease classification
     
-    model = Sequential([
-        # First Convolutional Block
-        Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
-        BatchNormalization(),
-        MaxPooling2D(2, 2),
-        
-        # Second Convolutional Block
-        Conv2D(64, (3, 3), activation='relu'),
-        BatchNormalization(),
-        MaxPooling2D(2, 2),
-        
-        # Third Convolutional Block
-        Conv2D(128, (3, 3), activation='relu'),
-        BatchNormalization(),
-        MaxPooling2D(2, 2),
-        
-        # Fourth Convolutional Block
-        Conv2D(256, (3, 3), activation='relu'),
-        BatchNormalization(),
-        MaxPooling2D(2, 2),
-        
-        # Fifth Convolutional Block
-        Conv2D(512, (3, 3), activation='relu'),
-        BatchNormalization(),
-        MaxPooling2D(2, 2),
-        
-        # Flatten and Dense layers
-        Flatten(),
-        Dense(1024, activation='relu'),
-        Dropout(0.5),
-        Dense(512, activation='relu'),
-        Dropout(0.3),
-        Dense(num_classes, activation='softmax')
-    ])
-    
-    return model
-
-def train_cnn_model():
-    """Main function to train the CNN model"""
-    print("Starting CNN model training for plant disease detection...")
+    The model takes uint8 pixel batches of any size; resizing to input_shape and
+    scaling to [0, 1] happen inside it. architecture is one of ARCHITECTURES.
+    """
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture '{architecture}'. Choose from: {', '.join(ARCHITECTURES)}")
+    layers = [Input(shape=(None, None, 3), dtype='uint8', name='pixels'), *preprocessing_layers(input_shape[1::-1])]
     
-    # Try to download real dataset, fallback to sample data
+    if architecture == 'baseline':
+        layers += conv_blocks() + [
+            # Flatten and Dense layers
+            Flatten(),
+            Dense(1024, activation='relu'),
+            Dropout(0.5),
+            Dense(512, activation='relu'),
+            Dropout(0.3)
+        ]
+    elif architecture in ('gap', 'separable'):
+        layers += conv_blocks(separable=architecture == 'separable') + [GlobalAveragePooling2D(), Dropout(0.3)]
+    else:
+        weights = mobilenet_weights_path(image_size=input_shape[0])
+        print(f"MobileNetV2 backbone: {'ImageNet weights from ' + weights if weights else 'training from scratch'}")
+        backbone = tf.keras.applications.MobileNetV2(input_shape=input_shape, include_top=False, pooling='avg',
+                                                     weights=weights)
+        # MobileNetV2 expects pixels in [-1, 1]
+        layers += [Rescaling(2.0, offset=-1.0, name='mobilenet_scale'), backbone, Dropout(0.2)]
+    
+    layers.append(Dense(num_classes, activation='softmax'))
+    return Sequential(layers, name=f'plant_disease_{architecture}')
+
+def count_flops(model, image_size=(224, 224)):
+    """Floating-point operations for one image (multiply-adds count as two), or None if unavailable"""
     try:
-        dataset_path, classes = download_real_plantvillage_dataset()
-    except:
-        dataset_path, classes = download_sample_data()
+        from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+        spec = tf.TensorSpec((1, image_size[1], image_size[0], 3), tf.uint8)
+        frozen = convert_variables_to_constants_v2(
+            tf.function(lambda images: model(images, training=False)).get_concrete_function(spec))
+        options = (tf.compat.v1.profiler.ProfileOptionBuilder(tf.compat.v1.profiler.ProfileOptionBuilder
+                                                              .float_operation()).with_empty_output().build())
+        profile = tf.compat.v1.profiler.profile(graph=frozen.graph, run_meta=tf.compat.v1.RunMetadata(),
+                                                cmd='op', options=options)
+        return int(profile.total_float_ops)
+    except Exception as e:
+        print(f"Could not count FLOPs: {e}")
+        return None
+
+def profile_model(model, image_size=(224, 224), runs=20):
+    """Parameters, FLOPs, .h5 size without optimizer state and median CPU latency per image (batch of one)"""
+    import tempfile
     
-    num_classes = len(classes)
-    print(f"Number of classes: {num_classes}")
-    print(f"Classes: {classes}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.h5')
+        # Optimizer slots would triple a trained model's size and make it incomparable to an untrained one
+        model.save(path, include_optimizer=False)
+        size_mb = os.path.getsize(path) / 1e6
     
-    # Save class names
-    os.makedirs('models', exist_ok=True)
-    with open('models/class_names.json', 'w') as f:
-        json.dump(classes, f, indent=2)
+    image = np.random.default_rng(0).integers(0, 256, (1, image_size[1], image_size[0], 3), dtype=np.uint8)
+    with tf.device('/CPU:0'):
+        for _ in range(3):
+            model.predict(image, verbose=0)
+        latencies = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            model.predict(image, verbose=0)
+            latencies.append(time.perf_counter() - start)
+    return {
+        'params': int(model.count_params()),
+        'flops': count_flops(model, image_size),
+        'size_mb': round(size_mb, 2),
+        'cpu_latency_ms': round(float(np.median(latencies)) * 1000, 2)
+    }
+
+def compare_architectures(num_classes=12, latency_budget_ms=None):
+    """Profile every preset (untrained) and print them, marking those within the latency budget"""
+    results = {}
+    print(f"{'architecture':12s} {'params':>12s} {'GFLOPs':>8s} {'size MB':>8s} {'CPU ms/img':>11s}")
+    for architecture in ARCHITECTURES:
+        profile = profile_model(create_cnn_model(num_classes, architecture=architecture))
+        results[architecture] = profile
+        flops = f"{profile['flops'] / 1e9:.2f}" if profile['flops'] is not None else 'n/a'
+        within = ''
+        if latency_budget_ms is not None:
+            within = '  within budget' if profile['cpu_latency_ms'] <= latency_budget_ms else '  over budget'
+        print(f"{architecture:12s} {profile['params']:12,d} {flops:>8s} {profile['size_mb']:8.1f} "
+              f"{profile['cpu_latency_ms']:11.2f}{within}")
+    return results
+
+def report_stage(progress_queue, stage):
+    """Put a stage event on a training job's progress queue, if there is one"""
+    if progress_queue is not None:
+        progress_queue.put({'event': 'stage', 'stage': stage})
+
+class ProgressCallback(Callback):
+    """Report per-epoch and (throttled) per-batch progress as dicts on a queue"""
     
-    # Data preprocessing and augmentation
+    def __init__(self, events, epochs, min_interval=1.0):
+        super().__init__()
+        self.events = events
+        self.epochs = epochs
+        self.min_interval = min_interval
+        self.epoch = 0
+        self._last_batch_report = 0.0
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch + 1
+    
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.monotonic()
+        if now - self._last_batch_report < self.min_interval:
+            return
+        self._last_batch_report = now
+        self.events.put({'event': 'batch', 'epoch': self.epoch, 'epochs': self.epochs, 'batch': batch + 1,
+                         'batches': self.params.get('steps'), 'logs': _float_logs(logs)})
+    
+    def on_epoch_end(self, epoch, logs=None):
+        self.events.put({'event': 'epoch', 'epoch': epoch + 1, 'epochs': self.epochs,
+                         'logs': _float_logs(logs)})
+
+def _float_logs(logs):
+    return {k: float(v) for k, v in (logs or {}).items()}
+
+def to_pixels(images):
+    """Round float images (after resize/augmentation) back to the uint8 pixels the model takes"""
+    return tf.cast(tf.clip_by_value(tf.round(images), 0, 255), tf.uint8)
+
+def build_augmentation():
+    """Random rotation/shift/zoom/flip matching the ImageDataGenerator settings"""
+    return Sequential([
+        tf.keras.layers.RandomRotation(20 / 360, fill_mode='nearest'),
+        tf.keras.layers.RandomTranslation(0.2, 0.2, fill_mode='nearest'),
+        tf.keras.layers.RandomZoom(0.2, fill_mode='nearest'),
+        tf.keras.layers.RandomFlip('horizontal')
+    ], name='augmentation')
+
+def make_image_dataset(directory, classes, subset=None, augment=False, shuffle=True, cache=None,
+                       batch_size=32, image_size=(224, 224), validation_split=0.2, seed=123):
+    """tf.data pipeline: parallel file reads and decode, optional cache, augmentation, prefetch.
+    
+    cache is None (decode every epoch), 'memory', or a file path prefix for an on-disk
+    cache of the decoded, resized images. Augmentation runs after the cache so every
+    epoch still sees fresh random views. Batches are uint8 pixels; the model rescales them.
+    """
+    autotune = tf.data.AUTOTUNE
+    dataset = tf.keras.utils.image_dataset_from_directory(
+        directory,
+        labels='inferred',
+        label_mode='categorical',
+        class_names=classes,
+        image_size=image_size,
+        batch_size=None,
+        # The file list must be shuffled identically for both subsets or they would overlap
+        shuffle=shuffle or subset is not None,
+        seed=seed,
+        validation_split=validation_split if subset else None,
+        subset=subset
+    )
+    # Cached as uint8: a quarter of the float32 size
+    dataset = dataset.map(lambda image, label: (to_pixels(image), label), num_parallel_calls=autotune)
+    if cache == 'memory':
+        dataset = dataset.cache()
+    elif cache:
+        os.makedirs(os.path.dirname(cache) or '.', exist_ok=True)
+        dataset = dataset.cache(cache)
+    if shuffle:
+        dataset = dataset.shuffle(1000, seed=seed)
+    dataset = dataset.batch(batch_size, num_parallel_calls=autotune)
+    if augment:
+        augmentation = build_augmentation()
+        dataset = dataset.map(lambda images, labels: (to_pixels(augmentation(images, training=True)), labels),
+                              num_parallel_calls=autotune)
+    return dataset.prefetch(autotune)
+
+def make_shard_dataset(shard_dir, split='train', subset=None, augment=False, shuffle=True,
+                       batch_size=32, validation_split=0.2, seed=123, soft_targets=None):
+    """tf.data pipeline over the memory-mapped shards written by dataset_shards.py
+    
+    soft_targets, one row per shard row, is appended to each one-hot label (for distillation).
+    """
+    from dataset_shards import ShardedSplit
+    
+    data = ShardedSplit(shard_dir, split)
+    indices = np.arange(len(data))
+    if subset:
+        # Seeded 80/20 split of the shard rows, disjoint between the two subsets
+        indices = np.random.default_rng(seed).permutation(len(data))
+        num_validation = int(len(data) * validation_split)
+        indices = indices[:num_validation] if subset == 'validation' else indices[num_validation:]
+    num_classes = len(data.classes)
+    height, width = data.image_size[1], data.image_size[0]
+    epoch = [0]
+    
+    def batches():
+        order = np.random.default_rng(seed + epoch[0]).permutation(indices) if shuffle else indices
+        epoch[0] += 1
+        for start in range(0, len(order), batch_size):
+            # Sorted reads keep memory-mapped access sequential within a shard
+            rows = np.sort(order[start:start + batch_size])
+            images, labels = data.read(rows)
+            labels = np.eye(num_classes, dtype=np.float32)[labels]
+            if soft_targets is not None:
+                labels = np.concatenate([labels, soft_targets[rows]], axis=1)
+            yield images, labels
+    
+    autotune = tf.data.AUTOTUNE
+    label_width = num_classes * (2 if soft_targets is not None else 1)
+    dataset = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((None, height, width, 3), tf.uint8),
+        tf.TensorSpec((None, label_width), tf.float32)
+    ))
+    if augment:
+        augmentation = build_augmentation()
+        dataset = dataset.map(lambda images, labels: (to_pixels(augmentation(images, training=True)), labels),
+                              num_parallel_calls=autotune)
+    return dataset.prefetch(autotune)
+
+def make_file_dataset(paths, labels, num_classes, augment=False, shuffle=True, batch_size=32,
+                      image_size=(224, 224), seed=123, rescale=False):
+    """tf.data pipeline over an explicit list of image files, decoded and resized like make_image_dataset
+    
+    rescale=True yields [0, 1] floats, for models from before the preprocessing layers were added.
+    """
+    autotune = tf.data.AUTOTUNE
+    
+    def load(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.resize(image, (image_size[1], image_size[0]))
+        return to_pixels(image), tf.one_hot(label, num_classes)
+    
+    dataset = tf.data.Dataset.from_tensor_slices((list(paths), np.asarray(labels, dtype=np.int32)))
+    if shuffle:
+        dataset = dataset.shuffle(len(paths), seed=seed)
+    dataset = dataset.map(load, num_parallel_calls=autotune).batch(batch_size)
+    if augment:
+        augmentation = build_augmentation()
+        dataset = dataset.map(lambda images, labels: (to_pixels(augmentation(images, training=True)), labels),
+                              num_parallel_calls=autotune)
+    if rescale:
+        dataset = dataset.map(lambda images, labels: (tf.cast(images, tf.float32) / 255.0, labels),
+                              num_parallel_calls=autotune)
+    return dataset.prefetch(autotune)
+
+CHECKPOINT_DIR = 'checkpoints'
+
+def resumable_checkpoint(run, *key):
+    """BackupAndRestore callback: weights, optimizer state and epoch are saved every epoch
+    
+    A run that is interrupted resumes from its last epoch the next time the same run
+    (same name and key) starts; the backup is deleted when training finishes.
+    """
+    import hashlib
+    digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:12]
+    return BackupAndRestore(backup_dir=os.path.join(CHECKPOINT_DIR, f"{run}_{digest}"))
+
+def make_generators(dataset_path, batch_size=32):
+    """Legacy ImageDataGenerator training/validation iterators (0-255 pixels; the model rescales)"""
     train_datagen = ImageDataGenerator(
-        rescale=1./255,
         rotation_range=20,
         width_shift_range=0.2,
         height_shift_range=0.2,
@@ -162,13 +395,10 @@ def train_cnn_model():
         validation_split=0.2
     )
     
-    test_datagen = ImageDataGenerator(rescale=1./255)
-    
-    # Load training data
     train_generator = train_datagen.flow_from_directory(
         f'{dataset_path}/train',
         target_size=(224, 224),
-        batch_size=32,
+        batch_size=batch_size,
         class_mode='categorical',
         subset='training'
     )
@@ -176,24 +406,107 @@ def train_cnn_model():
     validation_generator = train_datagen.flow_from_directory(
         f'{dataset_path}/train',
         target_size=(224, 224),
-        batch_size=32,
+        batch_size=batch_size,
         class_mode='categorical',
         subset='validation'
     )
+    return train_generator, validation_generator
+
+def benchmark_input_pipelines(dataset_path='data/PlantVillage', classes=None, epochs=2, batch_size=32):
+    """Time full passes over the training split with the legacy generator and with tf.data"""
+    import time
+    classes = classes or sorted(os.listdir(f'{dataset_path}/train'))
+    results = {}
+    
+    train_generator, _ = make_generators(dataset_path, batch_size)
+    steps = len(train_generator)
+    epoch_times = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for _ in range(steps):
+            next(train_generator)
+        epoch_times.append(time.perf_counter() - start)
+    results['generator'] = epoch_times
     
-    # Load test data if available
-    test_generator = None
-    if os.path.exists(f'{dataset_path}/test'):
-        test_generator = test_datagen.flow_from_directory(
-            f'{dataset_path}/test',
-            target_size=(224, 224),
-            batch_size=32,
-            class_mode='categorical'
-        )
+    for name, cache in [('tf.data', None), ('tf.data+cache', 'memory')]:
+        dataset = make_image_dataset(f'{dataset_path}/train', classes, subset='training',
+                                     augment=True, cache=cache, batch_size=batch_size)
+        epoch_times = []
+        for _ in range(epochs):
+            start = time.perf_counter()
+            for _ in dataset:
+                pass
+            epoch_times.append(time.perf_counter() - start)
+        results[name] = epoch_times
+    
+    for name, epoch_times in results.items():
+        print(f"{name:14s} " + ", ".join(f"epoch {i + 1}: {t:.2f}s" for i, t in enumerate(epoch_times)))
+    return results
+
+def train_cnn_model(input_pipeline='tfdata', cache=None, shard_dir='data/shards', progress_queue=None,
+                    architecture='baseline'):
+    """Main function to train the CNN model
+    
+    input_pipeline is 'tfdata' (parallel tf.data, default) or 'generator' (legacy
+    ImageDataGenerator); cache is passed to make_image_dataset. When shard_dir holds
+    shards from dataset_shards.py, training reads them instead of the image folders.
+    progress_queue, if given, receives progress dicts (see ProgressCallback).
+    architecture picks a preset from ARCHITECTURES; its profile is published with the accuracy.
+    """
+    print("Starting CNN model training for plant disease detection...")
+    
+    report_stage(progress_queue, 'loading data')
+    
+    from dataset_shards import has_shards, shard_image_paths
+    from score_images import find_images
+    use_shards = bool(shard_dir) and has_shards(shard_dir) and input_pipeline != 'generator'
+    if use_shards:
+        with open(os.path.join(shard_dir, 'index.json'), 'r') as f:
+            index = json.load(f)
+        dataset_path, classes = index['source'], index['classes']
+        trained_images = shard_image_paths(index)
+        print(f"Training from preprocessed shards in {shard_dir}")
+    else:
+        # Try to download real dataset, fallback to sample data
+        try:
+            dataset_path, classes = download_real_plantvillage_dataset()
+        except:
+            dataset_path, classes = download_sample_data()
+        # Listed before training, so images added during the run count as new for fine_tune_model
+        trained_images = [os.path.relpath(path, f'{dataset_path}/train')
+                          for path, label in find_images(f'{dataset_path}/train') if label in classes]
+    
+    num_classes = len(classes)
+    print(f"Number of classes: {num_classes}")
+    print(f"Classes: {classes}")
+    
+    # Save class names
+    os.makedirs('models', exist_ok=True)
+    with open('models/class_names.json', 'w') as f:
+        json.dump(classes, f, indent=2)
+    
+    # Data preprocessing and augmentation
+    if input_pipeline == 'generator':
+        train_data, validation_data = make_generators(dataset_path)
+    elif use_shards:
+        train_data = make_shard_dataset(shard_dir, subset='training', augment=True)
+        validation_data = make_shard_dataset(shard_dir, subset='validation', shuffle=False)
+    else:
+        train_data = make_image_dataset(f'{dataset_path}/train', classes, subset='training',
+                                        augment=True, cache=cache and f'{cache}_train')
+        validation_data = make_image_dataset(f'{dataset_path}/train', classes, subset='validation',
+                                             shuffle=False, cache=cache and f'{cache}_validation')
+    
+    # Load test data if available; unshuffled, and labels travel with their images either way
+    test_data = None
+    if use_shards and 'test' in index['splits']:
+        test_data = make_shard_dataset(shard_dir, split='test', shuffle=False)
+    elif os.path.exists(f'{dataset_path}/test'):
+        test_data = make_image_dataset(f'{dataset_path}/test', classes, shuffle=False)
     
     # Create and compile model
-    print("Creating CNN model...")
-    model = create_cnn_model(num_classes)
+    print(f"Creating CNN model ({architecture})...")
+    model = create_cnn_model(num_classes, architecture=architecture)
     
     model.compile(
         optimizer=Adam(learning_rate=0.001),
@@ -223,66 +536,579 @@ def train_cnn_model():
             factor=0.2,
             patience=5,
             min_lr=0.0001
-        )
+        ),
+        # Picks up an interrupted run of the same configuration at its last epoch
+        resumable_checkpoint('train', architecture, input_pipeline, use_shards, classes)
     ]
     
     # Train the model
     print("Starting training...")
     epochs = 50
+    if progress_queue is not None:
+        callbacks.append(ProgressCallback(progress_queue, epochs))
+    report_stage(progress_queue, 'training')
     
     history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // train_generator.batch_size,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // validation_generator.batch_size,
+        train_data,
+        validation_data=validation_data,
         epochs=epochs,
         callbacks=callbacks,
         verbose=1
     )
     
+    # ModelCheckpoint saved the best val_accuracy epoch, but EarlyStopping left the best val_loss
+    # weights in memory; evaluation and every export use the saved file, the one that gets published
+    from tensorflow.keras.models import load_model
+    model = load_model('models/plant_disease_model.h5')
+    
     # Evaluate model
-    if test_generator:
+    test_report = None
+    if test_data is not None:
+        report_stage(progress_queue, 'evaluating')
         print("Evaluating model on test data...")
-        test_loss, test_accuracy = model.evaluate(test_generator)
-        print(f"Test Accuracy: {test_accuracy:.4f}")
-        
-        # Generate predictions for classification report
-        predictions = model.predict(test_generator)
-        predicted_classes = np.argmax(predictions, axis=1)
-        true_classes = test_generator.classes
-        
-        # Print classification report
-        print("\nClassification Report:")
-        print(classification_report(true_classes, predicted_classes, target_names=classes))
-    
-    # Plot training history
-    plt.figure(figsize=(12, 4))
-    
-    plt.subplot(1, 2, 1)
-    plt.plot(history.history['accuracy'], label='Training Accuracy')
-    plt.plot(history.history['val_accuracy'], label='Validation Accuracy')
-    plt.title('Model Accuracy')
-    plt.xlabel('Epoch')
-    plt.ylabel('Accuracy')
-    plt.legend()
-    
-    plt.subplot(1, 2, 2)
-    plt.plot(history.history['loss'], label='Training Loss')
-    plt.plot(history.history['val_loss'], label='Validation Loss')
-    plt.title('Model Loss')
-    plt.xlabel('Epoch')
-    plt.ylabel('Loss')
-    plt.legend()
-    
-    plt.tight_layout()
-    plt.savefig('static/images/training_history.png')
-    plt.close()
+        test_report = evaluate_model(model, test_data, classes)
+        print(f"Test Accuracy: {test_report['accuracy']:.4f}")
+    
+    # Plot training history in a separate process
+    with open('models/training_history.json', 'w') as f:
+        json.dump({key: [float(value) for value in values] for key, values in history.history.items()}, f)
+    plot_history_in_background('models/training_history.json')
     
     print("Model training completed!")
     print(f"Model saved as: models/plant_disease_model.h5")
     print(f"Class names saved as: models/class_names.json")
+    if test_report:
+        print(f"Evaluation report saved as: models/evaluation_report.json")
+    
+    # Quantized variants for CPU-only serving (selected in app.py with MODEL_RUNTIME)
+    report_stage(progress_queue, 'exporting')
+    export_serving_models(model, f'{dataset_path}/train')
+    record_trained_images(classes, trained_images)
     
+    # Publish as a new registry version; serving workers pick it up automatically
+    from model_registry import ModelRegistry
+    metrics = {'test_accuracy': test_report['accuracy'], 'test_loss': test_report['loss']} if test_report else {}
+    # Size and speed next to accuracy, so versions can be compared against a latency budget
+    metrics.update(profile_model(model), architecture=architecture)
+    version = ModelRegistry().publish('models', metrics=metrics)
+    print(f"Published model version: {version}")
+    
+    return model, classes
+
+TRAINED_IMAGES_FILE = 'models/trained_images.json'
+
+def record_trained_images(classes, images, path=TRAINED_IMAGES_FILE):
+    """Remember which training images (relative to the train folder) the saved model was fitted on,
+    so fine_tune_model can find new ones"""
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump({'classes': classes, 'images': images}, f)
+    os.replace(f"{path}.tmp", path)
+
+def production_model():
+    """(.h5 path, class names, version) of the registry's active version, else of models/"""
+    from model_registry import ModelRegistry
+    from model_runtime import RUNTIME_FILES
+    registry = ModelRegistry()
+    version = registry.active_version()
+    model_dir = registry.version_dir(version) if version else 'models'
+    with open(os.path.join(model_dir, 'class_names.json'), 'r') as f:
+        class_names = json.load(f)
+    return os.path.join(model_dir, RUNTIME_FILES['keras']), class_names, version
+
+def expand_classifier(model, old_classes, classes):
+    """Copy of model with one softmax unit per class; units of classes it already knows keep their weights"""
+    old_kernel, old_bias = model.layers[-1].get_weights()
+    head = Dense(len(classes), activation='softmax')
+    expanded = Sequential([Input(shape=model.input_shape[1:], dtype=model.inputs[0].dtype), *model.layers[:-1], head],
+                          name=model.name)
+    kernel, bias = head.get_weights()
+    for old_index, name in enumerate(old_classes):
+        if name in classes:
+            kernel[:, classes.index(name)] = old_kernel[:, old_index]
+            bias[classes.index(name)] = old_bias[old_index]
+    head.set_weights([kernel, bias])
+    return expanded
+
+def fine_tune_model(dataset_path='data/PlantVillage', replay_per_class=50, epochs=10, learning_rate=1e-4,
+                    validation_split=0.2, seed=123, progress_queue=None):
+    """Continue training the production model on images added since it was trained
+    
+    New images are those missing from models/trained_images.json (or, for models
+    trained before it existed, files newer than the model). Up to replay_per_class
+    old images of every known class are mixed in so the model keeps what it learned.
+    New class folders get new output units. Returns None when nothing is new.
+    """
+    from tensorflow.keras.models import load_model
+    from score_images import find_images
+    
+    report_stage(progress_queue, 'loading data')
+    
+    model_path, old_classes, version = production_model()
+    train_dir = f'{dataset_path}/train'
+    classes = sorted(name for name in os.listdir(train_dir) if os.path.isdir(os.path.join(train_dir, name)))
+    items = find_images(train_dir)
+    seen = None
+    if os.path.exists(TRAINED_IMAGES_FILE):
+        with open(TRAINED_IMAGES_FILE, 'r') as f:
+            seen = set(json.load(f)['images'])
+        is_new = lambda path: os.path.relpath(path, train_dir) not in seen
+    else:
+        trained_at = os.path.getmtime(model_path)
+        is_new = lambda path: os.path.getmtime(path) > trained_at
+    new_items = [(path, label) for path, label in items if is_new(path)]
+    new_paths = {path for path, _ in new_items}
+    old_items = {}
+    for path, label in items:
+        if path not in new_paths:
+            old_items.setdefault(label, []).append((path, label))
+    if not new_items:
+        print("No images were added since the production model was trained; nothing to fine-tune")
+        return None
+    new_classes = [name for name in classes if name not in old_classes]
+    
+    rng = np.random.default_rng(seed)
+    replay_items = []
+    for name in classes:
+        old = old_items.get(name, [])
+        if old:
+            picks = rng.choice(len(old), min(replay_per_class, len(old)), replace=False)
+            replay_items += [old[i] for i in sorted(picks)]
+    print(f"Fine-tuning {version or model_path} on {len(new_items)} new images "
+          f"({len(new_classes)} new classes) with {len(replay_items)} replayed images")
+    
+    selected = [new_items[i] for i in rng.permutation(len(new_items))] + replay_items
+    order = rng.permutation(len(selected))
+    num_validation = max(1, int(len(selected) * validation_split))
+    paths = [selected[i][0] for i in order]
+    labels = [classes.index(selected[i][1]) for i in order]
+
+    model = load_model(model_path)
+    if classes != old_classes:
+        model = expand_classifier(model, old_classes, classes)
+    rescale = not takes_raw_pixels(model)
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss='categorical_crossentropy', metrics=['accuracy'])
+    train_data = make_file_dataset(paths[num_validation:], labels[num_validation:], len(classes), augment=True,
+                                   rescale=rescale)
+    validation_data = make_file_dataset(paths[:num_validation], labels[:num_validation], len(classes),
+                                        shuffle=False, rescale=rescale)
+    callbacks = [
+        EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
+        resumable_checkpoint('finetune', model_path, classes, len(new_items))
+    ]
+    if progress_queue is not None:
+        callbacks.append(ProgressCallback(progress_queue, epochs))
+    report_stage(progress_queue, 'training')
+    model.fit(train_data, validation_data=validation_data, epochs=epochs, callbacks=callbacks, verbose=1)
+    _, val_accuracy = model.evaluate(validation_data, verbose=0)
+    
+    os.makedirs('models', exist_ok=True)
+    model.save('models/plant_disease_model.h5')
+    with open('models/class_names.json', 'w') as f:
+        json.dump(classes, f, indent=2)
+    report_stage(progress_queue, 'exporting')
+    export_serving_models(model, train_dir)
+    # Everything the previous model saw plus the images this run used
+    previous = seen if seen is not None else {os.path.relpath(path, train_dir) for path, _ in items
+                                              if path not in new_paths}
+    record_trained_images(classes, sorted(previous | {os.path.relpath(path, train_dir) for path in paths}))
+    
+    from model_registry import ModelRegistry
+    metrics = {'val_accuracy': float(val_accuracy), 'fine_tuned_from': version, 'new_images': len(new_items),
+               'replay_images': len(replay_items), 'new_classes': new_classes}
+    if version:
+        # Same architecture as the base, and a fine-tuned student is still a student (see teacher_model)
+        base_metrics = ModelRegistry().manifest(version).get('metrics', {})
+        metrics.update({key: base_metrics[key] for key in ('architecture', 'distilled_from') if key in base_metrics})
+    metrics.update(profile_model(model))
+    published = ModelRegistry().publish('models', metrics=metrics)
+    print(f"Published fine-tuned model version: {published}")
     return model, classes
 
+def teacher_soft_targets(teacher, teacher_path, shard_dir, split='train', batch_size=64, cache_dir='cache'):
+    """Teacher log-probabilities for every row of a shard split, computed once and cached on disk
+    
+    The cache file is keyed by the teacher file and the shard index, so it is reused
+    across distillation runs until either changes.
+    """
+    from dataset_shards import ShardedSplit, INDEX_FILE
+    import hashlib
+    
+    stat = os.stat(teacher_path)
+    with open(os.path.join(shard_dir, INDEX_FILE), 'rb') as f:
+        index_digest = hashlib.sha1(f.read()).hexdigest()
+    key = hashlib.sha1(f"{os.path.abspath(teacher_path)}:{stat.st_size}:{stat.st_mtime_ns}:"
+                       f"{index_digest}:{split}".encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f'teacher_targets_{key}.npy')
+    if os.path.exists(path):
+        print(f"Using cached teacher targets: {path}")
+        return np.load(path, mmap_mode='r')
+    
+    data = ShardedSplit(shard_dir, split)
+    targets = np.empty((len(data), len(data.classes)), dtype=np.float32)
+    print(f"Running the teacher over {len(data)} {split} images...")
+    for start in range(0, len(data), batch_size):
+        rows = np.arange(start, min(start + batch_size, len(data)))
+        images, _ = data.read(rows)
+        probabilities = teacher.predict(_model_input(teacher, images), verbose=0)
+        targets[rows] = np.log(np.clip(probabilities, 1e-7, 1.0))
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(f"{path}.tmp", 'wb') as f:
+        np.save(f, targets)
+    os.replace(f"{path}.tmp", path)
+    return targets
+
+def distillation_loss(num_classes, temperature=4.0, alpha=0.7):
+    """alpha * T^2 * KL(teacher || student) at temperature T, plus (1 - alpha) * hard-label cross-entropy
+    
+    y_true is the one-hot label followed by the teacher's log-probabilities.
+    """
+    def loss(y_true, y_pred):
+        labels, teacher_logits = y_true[:, :num_classes], y_true[:, num_classes:]
+        # log(softmax) is a valid set of logits for the student's softmax output
+        student_logits = tf.math.log(tf.clip_by_value(y_pred, 1e-7, 1.0))
+        teacher_soft = tf.nn.softmax(teacher_logits / temperature)
+        kl = tf.reduce_sum(teacher_soft * (tf.math.log(tf.clip_by_value(teacher_soft, 1e-7, 1.0))
+                                           - tf.nn.log_softmax(student_logits / temperature)), axis=-1)
+        hard = tf.keras.losses.categorical_crossentropy(labels, y_pred)
+        return alpha * temperature ** 2 * kl + (1 - alpha) * hard
+    
+    def accuracy(y_true, y_pred):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, :num_classes], y_pred)
+    return loss, accuracy
+
+def evaluate_model(model, dataset, classes, report_path='models/evaluation_report.json'):
+    """Loss, accuracy, confusion matrix, per-class statistics and latency in one pass over dataset
+    
+    dataset yields (uint8 images, one-hot labels) batches. The report is written to
+    report_path as JSON (unless it is None) and returned.
+    """
+    from score_images import class_statistics
+    
+    num_classes = len(classes)
+    confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+    loss_sum = 0.0
+    batch_seconds = []
+    for images, labels in dataset:
+        start = time.perf_counter()
+        probabilities = np.asarray(model.predict_on_batch(_model_input(model, images)))
+        batch_seconds.append(time.perf_counter() - start)
+        true = np.argmax(np.asarray(labels)[:, :num_classes], axis=1)
+        predicted = np.argmax(probabilities, axis=1)
+        loss_sum -= float(np.sum(np.log(np.clip(probabilities[np.arange(len(true)), true], 1e-7, 1.0))))
+        confusion += np.bincount(true * num_classes + predicted, minlength=num_classes ** 2).reshape(confusion.shape)
+    
+    total = int(confusion.sum())
+    batch_ms = np.array(batch_seconds) * 1000
+    report = {
+        'created': time.time(),
+        'images': total,
+        'loss': loss_sum / total if total else None,
+        'accuracy': float(np.trace(confusion) / total) if total else None,
+        'latency': {
+            'batches': len(batch_ms),
+            'batch_ms_p50': float(np.percentile(batch_ms, 50)) if len(batch_ms) else None,
+            'batch_ms_p95': float(np.percentile(batch_ms, 95)) if len(batch_ms) else None,
+            'batch_ms_max': float(batch_ms.max()) if len(batch_ms) else None,
+            'ms_per_image': float(batch_ms.sum() / total) if total else None,
+            'images_per_second': float(total / batch_ms.sum() * 1000) if total and batch_ms.sum() else None
+        },
+        'classes': class_statistics(confusion, classes),
+        'confusion_matrix': confusion.tolist()
+    }
+    
+    print(f"\n{'class':40s} {'precision':>9s} {'recall':>9s} {'f1':>9s} {'support':>8s}")
+    for stats in report['classes']:
+        print(f"{stats['class'][:40]:40s} {stats['precision']:9.4f} {stats['recall']:9.4f} "
+              f"{stats['f1']:9.4f} {stats['support']:8d}")
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(f"{report_path}.tmp", 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(f"{report_path}.tmp", report_path)
+    return report
+
+def plot_history_in_background(history_path, output='static/images/training_history.png'):
+    """Draw the training curves with plot_history.py in its own process; nothing waits for it"""
+    import subprocess
+    import sys
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plot_history.py')
+    subprocess.Popen([sys.executable, script, history_path, output], start_new_session=True,
+                     stdout=subprocess.DEVNULL)
+
+def teacher_model(teacher_path=None):
+    """(.h5 path, class names or None, name) of the distillation teacher
+    
+    An explicit teacher_path uses the class_names.json next to it, if any. Otherwise
+    the teacher is the newest registry version without 'distilled_from' in its
+    metrics, so a student is never distilled from another student.
+    """
+    if teacher_path:
+        names_path = os.path.join(os.path.dirname(teacher_path) or '.', 'class_names.json')
+        class_names = None
+        if os.path.exists(names_path):
+            with open(names_path, 'r') as f:
+                class_names = json.load(f)
+        return teacher_path, class_names, teacher_path
+    
+    from model_registry import ModelRegistry
+    from model_runtime import RUNTIME_FILES
+    registry = ModelRegistry()
+    for version in reversed(registry.versions()):
+        manifest = registry.manifest(version)
+        if 'distilled_from' not in manifest.get('metrics', {}):
+            return (os.path.join(registry.version_dir(version), RUNTIME_FILES['keras']), manifest['class_names'],
+                    version)
+    raise SystemExit("No trained (non-distilled) model version in the registry; pass --teacher")
+
+def distill_student(teacher_path=None, shard_dir='data/shards', architecture='separable', temperature=4.0,
+                    alpha=0.7, epochs=30, progress_queue=None):
+    """Train a small student on the trained model's soft targets and serve it as the new model
+    
+    The teacher defaults to the newest registry version that is not itself a
+    distilled student (see teacher_model). Images come from dataset_shards.py
+    shards, built on first use.
+    """
+    from tensorflow.keras.models import load_model
+    from dataset_shards import build_shards, has_shards, shard_image_paths
+    
+    teacher_path, teacher_classes, teacher_name = teacher_model(teacher_path)
+    print(f"Teacher: {teacher_name}")
+    if not has_shards(shard_dir):
+        report_stage(progress_queue, 'building shards')
+        build_shards('data/PlantVillage', shard_dir)
+    with open(os.path.join(shard_dir, 'index.json'), 'r') as f:
+        index = json.load(f)
+    classes = index['classes']
+    num_classes = len(classes)
+    
+    report_stage(progress_queue, 'teacher targets')
+    teacher = load_model(teacher_path)
+    if teacher_classes is not None and teacher_classes != classes:
+        raise ValueError("Teacher and shards have different class lists; rebuild the shards or pick another teacher")
+    if teacher.output_shape[-1] != num_classes:
+        raise ValueError(f"Teacher has {teacher.output_shape[-1]} outputs but the shards have {num_classes} classes")
+    soft_targets = teacher_soft_targets(teacher, teacher_path, shard_dir)
+    
+    print(f"Creating {architecture} student for {num_classes} classes...")
+    student = create_cnn_model(num_classes, architecture=architecture)
+    loss, accuracy = distillation_loss(num_classes, temperature, alpha)
+    student.compile(optimizer=Adam(learning_rate=0.001), loss=loss, metrics=[accuracy])
+    
+    train_data = make_shard_dataset(shard_dir, subset='training', augment=True, soft_targets=soft_targets)
+    validation_data = make_shard_dataset(shard_dir, subset='validation', shuffle=False, soft_targets=soft_targets)
+    callbacks = [
+        EarlyStopping(monitor='val_accuracy', mode='max', patience=8, restore_best_weights=True),
+        ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=4, min_lr=0.0001)
+    ]
+    if progress_queue is not None:
+        callbacks.append(ProgressCallback(progress_queue, epochs))
+    report_stage(progress_queue, 'training')
+    student.fit(train_data, validation_data=validation_data, epochs=epochs, callbacks=callbacks, verbose=1)
+    # Plain loss for the saved file, so serving loads it without the distillation loss
+    student.compile(optimizer=Adam(learning_rate=0.001), loss='categorical_crossentropy', metrics=['accuracy'])
+    
+    # Accuracy/latency trade-off on the test split
+    report_stage(progress_queue, 'evaluating')
+    test = make_shard_dataset(shard_dir, split='test', shuffle=False) if 'test' in index['splits'] else None
+    comparison = {}
+    for name, model in (('teacher', teacher), ('student', student)):
+        # The student becomes the served model, so its report replaces the evaluation report
+        report_path = 'models/evaluation_report.json' if name == 'student' else None
+        report = evaluate_model(model, test, classes, report_path) if test is not None else None
+        comparison[name] = dict(profile_model(model), test_accuracy=report['accuracy'] if report else None)
+    print(f"{'':8s} {'test acc':>9s} {'params':>12s} {'size MB':>8s} {'CPU ms/img':>11s}")
+    for name, result in comparison.items():
+        accuracy_text = f"{result['test_accuracy']:.4f}" if result['test_accuracy'] is not None else 'n/a'
+        print(f"{name:8s} {accuracy_text:>9s} {result['params']:12,d} {result['size_mb']:8.1f} "
+              f"{result['cpu_latency_ms']:11.2f}")
+    
+    os.makedirs('models', exist_ok=True)
+    student.save('models/plant_disease_model.h5')
+    with open('models/class_names.json', 'w') as f:
+        json.dump(classes, f, indent=2)
+    report_stage(progress_queue, 'exporting')
+    export_serving_models(student, f"{index['source']}/train")
+    record_trained_images(classes, shard_image_paths(index))
+    
+    from model_registry import ModelRegistry
+    metrics = dict(comparison['student'], architecture=architecture, distilled_from=teacher_name,
+                   teacher_test_accuracy=comparison['teacher']['test_accuracy'],
+                   teacher_cpu_latency_ms=comparison['teacher']['cpu_latency_ms'])
+    version = ModelRegistry().publish('models', metrics=metrics)
+    print(f"Published distilled model version: {version}")
+    return student, comparison
+
+def representative_images(image_dir, num_images=200, batch_size=1):
+    """Yield 0-255 float sample batches used to calibrate int8 quantization"""
+    from score_images import find_images
+    from image_io import load_image_batch
+    
+    items = find_images(image_dir)
+    rng = np.random.default_rng(0)
+    if len(items) > num_images:
+        items = [items[i] for i in sorted(rng.choice(len(items), num_images, replace=False))]
+    paths = [path for path, _ in items]
+    for i in range(0, len(paths), batch_size):
+        images, _ = load_image_batch(paths[i:i + batch_size])
+        yield [images.astype('float32')]
+
+def serving_model(model, dtype='uint8', image_size=(224, 224)):
+    """model's layers behind a fixed (N, height, width, 3) input of dtype, for export
+    
+    A Keras model rather than a tf.function, so the TFLite converter freezes its
+    variables (Keras 3 variables stay resource reads in a concrete function, which
+    int8 calibration cannot run).
+    """
+    # Layers are applied directly so a float32 input has no cast to uint8 and back
+    return Sequential([Input(shape=(image_size[1], image_size[0], 3), dtype=dtype, name='pixels'), *model.layers],
+                      name=f'{model.name}_serving')
+
+def export_serving_models(model, calibration_dir, model_dir='models'):
+    """Write float16 and int8 TFLite (and ONNX, when tf2onnx is installed) next to the .h5
+    
+    Every export takes uint8 pixels, like the Keras model. Models from before the
+    preprocessing layers were added keep their [0, 1] float input.
+    """
+    from model_runtime import RUNTIME_FILES
+    exported = {}
+    raw_input = takes_raw_pixels(model)
+    
+    def converter_for(dtype):
+        if raw_input:
+            return tf.lite.TFLiteConverter.from_keras_model(serving_model(model, dtype))
+        return tf.lite.TFLiteConverter.from_keras_model(model)
+    
+    def calibration_images():
+        for images in representative_images(calibration_dir):
+            yield images if raw_input else [images[0] / 255.0]
+    
+    # float16 weights: half the size, float32 activations, no calibration needed
+    converter = converter_for('uint8')
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    exported['tflite_fp16'] = converter.convert()
+    
+    # Full integer quantization, calibrated on training images
+    if os.path.isdir(calibration_dir):
+        # Calibrated on 0-255 floats, so the quantized uint8 input is the raw pixel value
+        converter = converter_for('float32')
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = calibration_images
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8 if raw_input else tf.int8
+        converter.inference_output_type = tf.int8
+        exported['tflite_int8'] = converter.convert()
+    else:
+        print(f"Skipping int8 export: no calibration images in {calibration_dir}")
+    
+    for kind, content in exported.items():
+        path = os.path.join(model_dir, RUNTIME_FILES[kind])
+        # Replace atomically: a serving process may have the old file memory-mapped
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(content)
+        os.replace(f"{path}.tmp", path)
+        print(f"Exported {kind}: {path} ({len(content) / 1e6:.1f} MB)")
+    
+    try:
+        import tf2onnx
+    except ImportError:
+        print("Skipping ONNX export: pip install tf2onnx onnxruntime")
+    else:
+        path = os.path.join(model_dir, RUNTIME_FILES['onnx'])
+        if raw_input:
+            tf2onnx.convert.from_keras(serving_model(model), output_path=path)
+        else:
+            spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+            tf2onnx.convert.from_keras(model, input_signature=spec, output_path=path)
+        print(f"Exported onnx: {path}")
+
+def check_runtime_parity(test_dir, runtimes=('tflite_fp16', 'tflite_int8', 'onnx'), tolerance=0.02,
+                         batch_size=32, model_dir='models'):
+    """Compare each exported runtime's test accuracy with the Keras model.
+    
+    Returns {runtime: accuracy}; raises AssertionError if any runtime is more than
+    tolerance below the Keras accuracy. Runtimes without an artifact are skipped.
+    """
+    from score_images import find_images
+    from image_io import load_image_batch
+    from model_runtime import load_runtime, runtime_path
+    
+    with open(os.path.join(model_dir, 'class_names.json'), 'r') as f:
+        class_index = {name: i for i, name in enumerate(json.load(f))}
+    items = [(path, class_index[label]) for path, label in find_images(test_dir) if label in class_index]
+    if not items:
+        raise ValueError(f"No labelled test images found under {test_dir}")
+    labels = np.array([label for _, label in items])
+    batches = [load_image_batch([path for path, _ in items[i:i + batch_size]])[0]
+               for i in range(0, len(items), batch_size)]
+    
+    def accuracy(kind):
+        runtime = load_runtime(kind, model_dir)
+        predicted = np.concatenate([np.argmax(runtime.predict(batch), axis=1) for batch in batches])
+        return float(np.mean(predicted == labels))
+    
+    results = {'keras': accuracy('keras')}
+    for kind in runtimes:
+        if not os.path.exists(runtime_path(kind, model_dir)):
+            print(f"Skipping {kind}: {runtime_path(kind, model_dir)} not found")
+            continue
+        results[kind] = accuracy(kind)
+    
+    for kind, acc in results.items():
+        print(f"{kind:12s} accuracy: {acc:.4f} ({acc - results['keras']:+.4f} vs keras)")
+    failed = [kind for kind, acc in results.items() if results['keras'] - acc > tolerance]
+    assert not failed, f"Accuracy dropped by more than {tolerance} for: {', '.join(failed)}"
+    return results
+
 if __name__ == "__main__":
-    train_cnn_model()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the plant disease CNN and export serving models")
+    parser.add_argument('--input-pipeline', choices=['tfdata', 'generator'], default='tfdata')
+    parser.add_argument('--architecture', choices=ARCHITECTURES, default=None,
+                        help="Model preset: baseline (default), gap, separable or mobilenet")
+    parser.add_argument('--compare-architectures', action='store_true',
+                        help="Print params, FLOPs, size and CPU latency of every preset and exit")
+    parser.add_argument('--latency-budget', type=float, default=None,
+                        help="With --compare-architectures, mark presets slower than this many ms per image")
+    parser.add_argument('--fine-tune', action='store_true',
+                        help="Fine-tune the production model on images added since it was trained")
+    parser.add_argument('--replay-per-class', type=int, default=50,
+                        help="Old images per class mixed into --fine-tune (default 50)")
+    parser.add_argument('--distill', action='store_true',
+                        help="Train a small student (--architecture, default separable) from the trained model")
+    parser.add_argument('--teacher', default=None,
+                        help="Teacher .h5 for --distill (default: newest registry version that is not a distilled student)")
+    parser.add_argument('--temperature', type=float, default=4.0, help="Softmax temperature for --distill")
+    parser.add_argument('--alpha', type=float, default=0.7,
+                        help="Weight of the teacher's soft targets versus the true labels for --distill")
+    parser.add_argument('--cache', default=None,
+                        help="Cache decoded images: 'memory' or a file prefix such as cache/tfdata")
+    parser.add_argument('--shards', default='data/shards',
+                        help="Train from dataset_shards.py output in this folder when present ('' to disable)")
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help="Compare epoch times of the generator and tf.data input pipelines and exit")
+    parser.add_argument('--export-only', action='store_true',
+                        help="Export TFLite/ONNX variants of models/plant_disease_model.h5 without training")
+    parser.add_argument('--check-parity', metavar='TEST_DIR',
+                        help="Check exported runtimes' accuracy on TEST_DIR against the Keras model")
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help="Largest allowed accuracy drop for --check-parity (default 0.02)")
+    args = parser.parse_args()
+    
+    if args.compare_architectures:
+        compare_architectures(latency_budget_ms=args.latency_budget)
+    elif args.fine_tune:
+        fine_tune_model(replay_per_class=args.replay_per_class)
+    elif args.distill:
+        distill_student(args.teacher, args.shards or 'data/shards', args.architecture or 'separable',
+                        args.temperature, args.alpha)
+    elif args.benchmark_input:
+        benchmark_input_pipelines()
+    elif args.export_only:
+        from tensorflow.keras.models import load_model
+        export_serving_models(load_model('models/plant_disease_model.h5'), 'data/PlantVillage/train')
+    elif not args.check_parity:
+        train_cnn_model(args.input_pipeline, args.cache, args.shards, architecture=args.architecture or 'baseline')
+    if args.check_parity:
+        check_runtime_parity(args.check_parity, tolerance=args.tolerance)
\ No newline at end of file
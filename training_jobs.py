@@ -0,0 +1,237 @@
+import fcntl
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+
+from sqlite_local import ThreadLocalSQLite
+
+# 'unchanged': a fine-tune run found no new images and published nothing
+TERMINAL_STATES = ('completed', 'failed', 'unchanged')
+
+
+def _run_training(events, options):
+    """Child-process entry point: train and report progress through the events queue"""
+    try:
+        # Imported here so TensorFlow only loads in the training process
+        from train_model import train_cnn_model, fine_tune_model
+        options = dict(options)
+        train = fine_tune_model if options.pop('mode', 'full') == 'finetune' else train_cnn_model
+        result = train(progress_queue=events, **options)
+        events.put({'event': 'trained' if result is not None else 'unchanged'})
+    except Exception as e:
+        events.put({'event': 'failed', 'error': str(e)})
+
+
+class TrainingJob:
+    """State of one background training run"""
+
+    def __init__(self, options, job_id=None, status='queued', error=None, created=None, started=None,
+                 finished=None, progress=None, next_seq=0):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.options = options
+        self.status = status
+        self.error = error
+        self.created = created or time.time()
+        self.started = started
+        self.finished = finished
+        self.progress = progress or {}
+        self.next_seq = next_seq
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'mode': self.options.get('mode', 'full'),
+            'status': self.status,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'progress': self.progress
+        }
+
+
+class TrainingJobStore:
+    """Jobs and their progress events in a SQLite file, so every gunicorn worker sees every job"""
+
+    COLUMNS = ('id', 'options', 'status', 'error', 'created', 'started', 'finished', 'progress', 'next_seq')
+
+    def __init__(self, path, max_jobs=20, max_events=1000):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.max_events = max_events
+        self._db = ThreadLocalSQLite(path)
+        with self._db.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS training_jobs ('
+                'id TEXT PRIMARY KEY, options TEXT NOT NULL, status TEXT NOT NULL, error TEXT, created REAL NOT NULL, '
+                'started REAL, finished REAL, progress TEXT NOT NULL, next_seq INTEGER NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS training_events ('
+                'job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, PRIMARY KEY (job_id, seq))'
+            )
+
+    def save(self, job, event=None):
+        """Write the job's state, and append event (which already carries its seq) if given"""
+        with self._db.connection() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO training_jobs ({', '.join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, json.dumps(job.options), job.status, job.error, job.created, job.started, job.finished,
+                 json.dumps(job.progress), job.next_seq)
+            )
+            if event is not None:
+                conn.execute('INSERT INTO training_events (job_id, seq, event) VALUES (?, ?, ?)',
+                             (job.id, event['seq'], json.dumps(event)))
+                conn.execute('DELETE FROM training_events WHERE job_id = ? AND seq <= ?',
+                             (job.id, event['seq'] - self.max_events))
+
+    def _job(self, row):
+        job_id, options, status, error, created, started, finished, progress, next_seq = row
+        return TrainingJob(json.loads(options), job_id, status, error, created, started, finished,
+                           json.loads(progress), next_seq)
+
+    def get(self, job_id):
+        row = self._db.connection().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM training_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def unfinished(self):
+        placeholders = ', '.join('?' * len(TERMINAL_STATES))
+        rows = self._db.connection().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM training_jobs WHERE status NOT IN ({placeholders}) "
+            'ORDER BY created DESC', TERMINAL_STATES).fetchall()
+        return [self._job(row) for row in rows]
+
+    def events_after(self, job_id, seq):
+        rows = self._db.connection().execute(
+            'SELECT event FROM training_events WHERE job_id = ? AND seq > ? ORDER BY seq', (job_id, seq)).fetchall()
+        return [json.loads(event) for event, in rows]
+
+    def prune(self):
+        """Forget all but the newest max_jobs jobs"""
+        with self._db.connection() as conn:
+            old = [job_id for job_id, in conn.execute(
+                'SELECT id FROM training_jobs ORDER BY created DESC LIMIT -1 OFFSET ?', (self.max_jobs,))]
+            conn.executemany('DELETE FROM training_events WHERE job_id = ?', [(job_id,) for job_id in old])
+            conn.executemany('DELETE FROM training_jobs WHERE id = ?', [(job_id,) for job_id in old])
+
+
+class TrainingJobManager:
+    """Run train_cnn_model in a separate process, one job at a time across all workers, and record its progress
+
+    The worker that starts a job holds an exclusive lock on lock_path until the job
+    ends; the lock is released by the OS if that worker dies.
+    """
+
+    def __init__(self, path='cache/training_jobs.sqlite3', on_complete=None, max_jobs=20, poll_interval=0.5):
+        self.store = TrainingJobStore(path, max_jobs=max_jobs)
+        self.lock_path = f"{path}.lock"
+        self.on_complete = on_complete
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        # spawn: the child must not inherit the serving process's threads or loaded model
+        self._ctx = multiprocessing.get_context('spawn')
+
+    def start(self, **options):
+        """Start a job, or return the running one; the bool is True when a new job was started"""
+        with self._lock:
+            lock_fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(lock_fd)
+                return self._running_elsewhere(), False
+            # Holding the lock, so unfinished jobs belong to a worker that died
+            for stale in self.store.unfinished():
+                self._publish(stale, {'event': 'failed', 'error': 'Training worker exited'}, status='failed',
+                              error='Training worker exited')
+            job = TrainingJob(options)
+            events = self._ctx.Queue()
+            process = self._ctx.Process(target=_run_training, args=(events, options),
+                                        name=f'training-{job.id}', daemon=True)
+            process.start()
+            job.started = time.time()
+            self._publish(job, {'event': 'started'}, status='running')
+            self.store.prune()
+        threading.Thread(target=self._watch, args=(job, process, events, lock_fd),
+                         name=f'training-watch-{job.id}', daemon=True).start()
+        return job, True
+
+    def _running_elsewhere(self, wait=2.0):
+        # The lock holder writes its job right after taking the lock
+        deadline = time.monotonic() + wait
+        while True:
+            unfinished = self.store.unfinished()
+            if unfinished:
+                return unfinished[0]
+            if time.monotonic() > deadline:
+                raise RuntimeError("Training is starting in another worker")
+            time.sleep(0.05)
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def events_after(self, job_id, seq, timeout=15.0):
+        """Events with a sequence number above seq, waiting up to timeout for new ones"""
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.store.events_after(job_id, seq)
+            if events or time.monotonic() > deadline:
+                return events
+            job = self.store.get(job_id)
+            if job is None or job.status in TERMINAL_STATES:
+                return []
+            time.sleep(self.poll_interval)
+
+    def _publish(self, job, event, status=None, error=None):
+        if status:
+            job.status = status
+        if error:
+            job.error = error
+        if job.status in TERMINAL_STATES:
+            job.finished = time.time()
+        event = dict(event, seq=job.next_seq, time=time.time(), status=job.status)
+        job.next_seq += 1
+        if event['event'] in ('epoch', 'batch', 'stage'):
+            job.progress.update({k: v for k, v in event.items() if k not in ('seq', 'time', 'status', 'event')})
+        self.store.save(job, event)
+
+    def _finish(self, job, status, lock_fd, error=None):
+        self._publish(job, {'event': status, 'error': error} if error else {'event': status}, status=status,
+                      error=error)
+        fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        os.close(lock_fd)
+
+    def _watch(self, job, process, events, lock_fd):
+        while True:
+            try:
+                event = events.get(timeout=1.0)
+            except queue.Empty:
+                if not process.is_alive():
+                    self._finish(job, 'failed', lock_fd, f"Training process exited with code {process.exitcode}")
+                    return
+                continue
+            if event['event'] == 'failed':
+                process.join()
+                self._finish(job, 'failed', lock_fd, event.get('error'))
+                return
+            if event['event'] == 'unchanged':
+                process.join()
+                self._finish(job, 'unchanged', lock_fd)
+                return
+            if event['event'] == 'trained':
+                process.join()
+                try:
+                    # Swap the new model in before reporting completion
+                    if self.on_complete:
+                        self.on_complete()
+                except Exception as e:
+                    self._finish(job, 'failed', lock_fd, f"Model reload failed: {e}")
+                    return
+                self._finish(job, 'completed', lock_fd)
+                return
+            self._publish(job, event)
@@ -0,0 +1,108 @@
+import os
+import re
+import time
+from collections import namedtuple
+
+from image_io import make_thumbnail, save_upload_async, write_file
+from lazy_thread import LazyThread
+
+THUMBNAIL_DIR = 'thumbs'
+# Only content-addressed files are managed; anything else in the folder is left alone
+_MANAGED_NAME = re.compile(r'^[0-9a-f]{24}\.[a-z0-9]+$')
+
+# name: content-addressed file name; url / thumbnail_url: where the browser fetches them
+# (thumbnail_url is None if the image could not be decoded);
+# saved: Future of the background write of the original (None if stored already or not kept)
+StoredUpload = namedtuple('StoredUpload', ['name', 'path', 'url', 'thumbnail_url', 'saved'])
+
+
+class UploadStore:
+    """Content-addressed upload storage with thumbnails and size/age-bounded retention"""
+
+    def __init__(self, root, url_prefix='/uploads', keep_originals=True, thumbnail_size=320,
+                 thumbnail_format='webp', max_bytes=1024 ** 3, max_age=7 * 86400, sweep_interval=600):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.keep_originals = keep_originals
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_format = thumbnail_format.lower()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+        self._stats = {'files': 0, 'bytes': 0, 'removed': 0, 'last_sweep': None}
+        self._sweeper = LazyThread(self._run, 'upload-sweeper')
+        os.makedirs(os.path.join(root, THUMBNAIL_DIR), exist_ok=True)
+
+    def save(self, data, content_hash, extension):
+        """Write the thumbnail now and the original in the background; both are named by content"""
+        name = f"{content_hash[:24]}.{extension}"
+        thumbnail_name = f"{content_hash[:24]}.{'jpg' if self.thumbnail_format == 'jpeg' else self.thumbnail_format}"
+        thumbnail_path = os.path.join(self.root, THUMBNAIL_DIR, thumbnail_name)
+        thumbnail_url = f"{self.url_prefix}/{THUMBNAIL_DIR}/{thumbnail_name}"
+        # Written before the response so the result card can load it straight away
+        if not self._touch(thumbnail_path):
+            try:
+                write_file(make_thumbnail(data, self.thumbnail_size, self.thumbnail_format.upper()), thumbnail_path)
+            except Exception as e:
+                # Undecodable image: keep the original (if stored) but don't link a thumbnail
+                print(f"Could not create thumbnail for {name}: {e}")
+                thumbnail_url = None
+
+        path = os.path.join(self.root, name)
+        saved = None
+        if self.keep_originals and not self._touch(path):
+            saved = save_upload_async(data, path)
+        return StoredUpload(name, path, f"{self.url_prefix}/{name}" if self.keep_originals else None,
+                            thumbnail_url, saved)
+
+    @staticmethod
+    def _touch(path):
+        """Refresh the age of an existing file so re-uploaded photos survive retention"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def ensure_started(self):
+        self._sweeper.ensure_started()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Upload retention sweep failed: {e}")
+            time.sleep(self.sweep_interval)
+
+    def _managed_files(self):
+        files = []
+        for directory in (self.root, os.path.join(self.root, THUMBNAIL_DIR)):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and _MANAGED_NAME.match(entry.name):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def sweep(self):
+        """Delete uploads older than max_age, then the oldest ones until under max_bytes"""
+        now = time.time()
+        files = sorted(self._managed_files())
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if not (self.max_age and now - mtime > self.max_age) and not (self.max_bytes and total > self.max_bytes):
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass  # Swept by another worker
+            total -= size
+        self._stats = {'files': len(files) - removed, 'bytes': total,
+                       'removed': self._stats['removed'] + removed, 'last_sweep': now}
+        return removed
+
+    def stats(self):
+        return dict(self._stats)